@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+"""
+******************************************************************************
+cli.py - Ponto de entrada de linha de comando para a plotagem dos mapas
+
+Exemplos:
+    python -m plotMap.cli ons input/*.dat -o output --jobs 4 --incremental
+    python -m plotMap.cli diff "input/ECMWF_p*.dat" -o /dados/mapas --json -
+    python -m plotMap.cli csv grande.csv -o output --bloco 2000000 --resolucao 0.25 --titulo "Chuva"
+    python -m plotMap.cli ons input -o output -j 4 --memoria --max-mapas-processo 200 --limite-memoria 1500
+
+Licença : MIT
+Dependências: matplotlib, plotMap
+******************************************************************************
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib
+
+# Os mapas são sempre gravados em arquivo: não é necessário um backend interativo.
+matplotlib.use('Agg')
+
+from plotMap import functions  # noqa: E402
+from plotMap.validacao import ErroValidacao  # noqa: E402
+from plotMap.memoria import MedidaMemoria, resumo_crescimento  # noqa: E402
+
+
+# Função de plotagem de cada produto.
+produtos = {
+    'ons': functions.plotMapaONS,
+    'acc': functions.plotMapaONS_acc,
+    'diff': functions.plotMapaONS_diff,
+    'csv': functions.plotMapaCSV,
+}
+
+
+def expande_entradas(entradas):
+    """Expande caminhos, pastas e padroes glob em uma lista ordenada de arquivos, sem duplicados
+
+    Args:
+        entradas (list): caminhos de arquivos, pastas ou padroes glob
+
+    Returns:
+        list: arquivos encontrados
+    """
+
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            arquivos.extend(glob.glob(os.path.join(entrada, '*.*')))
+        elif glob.has_magic(entrada):
+            arquivos.extend(glob.glob(entrada))
+        else:
+            arquivos.append(entrada)
+
+    return sorted(dict.fromkeys(os.path.abspath(a) for a in arquivos))
+
+
+def atualizado(arquivo_input, arquivo_destino):
+    """Verifica se o mapa de destino existe e eh mais recente que o arquivo de entrada
+
+    Args:
+        arquivo_input (string): caminho para o arquivo de entrada
+        arquivo_destino (string): caminho para o mapa
+    """
+
+    return (os.path.isfile(arquivo_destino) and
+            os.path.getmtime(arquivo_destino) >= os.path.getmtime(arquivo_input))
+
+
+def limpa_saida(pasta, formato):
+    """Apaga os mapas (arquivos com a extensao do formato) da pasta de destino, mantendo os demais arquivos
+
+    Args:
+        pasta (string): pasta de destino dos mapas
+        formato (string): formato dos mapas, pela extensao do arquivo
+
+    Returns:
+        int: numero de arquivos apagados
+    """
+
+    apagados = 0
+    for arquivo in glob.glob(os.path.join(glob.escape(pasta), '*.' + glob.escape(formato))):
+        if os.path.isfile(arquivo):
+            os.remove(arquivo)
+            apagados += 1
+
+    return apagados
+
+
+def renderiza(tarefa):
+    """Plota o mapa de um arquivo de entrada. Executada em um processo de trabalho quando --jobs > 1
+
+    Args:
+        tarefa (dict): produto, entrada, destino e opcoes da funcao de plotagem
+
+    Ao final de cada mapa, figuras e caches sao liberados e a memoria do processo eh medida
+    (ver memoria.MedidaMemoria).
+
+    Returns:
+        dict: resultado da plotagem (status 'renderizado', 'ignorado' ou 'erro'), tempo gasto e memoria
+    """
+
+    resultado = {'produto': tarefa['produto'], 'entrada': tarefa['entrada'],
+                 'destino': tarefa['destino'], 'status': 'renderizado', 'segundos': 0.0}
+
+    with MedidaMemoria(rastrear=tarefa.get('memoria', False)) as medida:
+        try:
+            # mensagens das funcoes de plotagem vao para stderr, preservando a saida JSON em stdout
+            with contextlib.redirect_stdout(sys.stderr):
+                gerados = produtos[tarefa['produto']](arquivo_input=tarefa['entrada'],
+                                                      arquivo_output=tarefa['destino'],
+                                                      limpa_output=False,
+                                                      **tarefa['opcoes'])
+            if not gerados:
+                resultado['status'] = 'ignorado'
+        except ErroValidacao as erro:
+            resultado['status'] = 'erro'
+            resultado['erro'] = str(erro)
+            resultado['validacao'] = erro.relatorio.para_dict()
+        except Exception as erro:
+            resultado['status'] = 'erro'
+            resultado['erro'] = str(erro)
+
+    resultado['segundos'] = round(medida.segundos, 4)
+    resultado['memoria'] = medida.para_dict()
+
+    return resultado
+
+
+def executa_tarefas(tarefas, jobs=1, max_mapas_processo=0, limite_memoria=0):
+    """Executa as tarefas no processo atual ou em processos de trabalho reciclaveis
+
+    Os processos de trabalho sao substituidos apos max_mapas_processo mapas cada um. Se algum processo
+    atingir limite_memoria (pico de RSS durante um mapa, em MB), novas tarefas deixam de ser enviadas e, concluidas
+    as que estao em andamento, todos os processos sao substituidos. Se um processo for encerrado abruptamente (por
+    exemplo, pelo sistema por falta de memoria), os mapas em andamento sao registrados com erro e os processos
+    sao substituidos para as tarefas restantes.
+
+    Args:
+        tarefas (list): tarefas (ver renderiza)
+        jobs (int): numero de processos de trabalho
+        max_mapas_processo (int): mapas por processo antes da substituicao (0 = sem limite)
+        limite_memoria (float): pico de RSS maximo por processo, em MB (0 = sem limite)
+
+    Returns:
+        tuple: (resultados na ordem de conclusao, numero de reciclagens dos processos de trabalho)
+    """
+
+    # sem paralelismo nem reciclagem, executa no proprio processo
+    if (jobs <= 1 and max_mapas_processo <= 0 and limite_memoria <= 0) or len(tarefas) == 0:
+        return [renderiza(t) for t in tarefas], 0
+
+    processos = max(1, min(jobs, len(tarefas)))
+    # max_tasks_per_child (Python >= 3.11) so eh informado quando necessario
+    opcoes = {'max_tasks_per_child': max_mapas_processo} if max_mapas_processo > 0 else {}
+    pendentes = list(tarefas)
+    resultados = []
+    reciclagens = 0
+
+    while pendentes:
+        reciclar = False
+        em_andamento = {}
+
+        with ProcessPoolExecutor(processos, **opcoes) as executor:
+            while (pendentes and not reciclar) or em_andamento:
+
+                # mantem no maximo um mapa em andamento por processo, para poder interromper o envio
+                while pendentes and not reciclar and len(em_andamento) < processos:
+                    tarefa = pendentes.pop(0)
+                    em_andamento[executor.submit(renderiza, tarefa)] = tarefa
+
+                concluidos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+
+                for futuro in concluidos:
+                    tarefa = em_andamento.pop(futuro)
+                    try:
+                        resultado = futuro.result()
+                    except Exception as erro:
+                        resultado = {'produto': tarefa['produto'], 'entrada': tarefa['entrada'],
+                                     'destino': tarefa['destino'], 'status': 'erro',
+                                     'erro': str(erro) or type(erro).__name__, 'segundos': 0.0}
+                        if isinstance(erro, BrokenProcessPool):
+                            resultado['erro'] = 'processo de trabalho encerrado abruptamente durante o mapa'
+                            if not reciclar:
+                                print("Processo de trabalho encerrado abruptamente: reciclando processos de "
+                                      "trabalho...", file=sys.stderr)
+                                reciclar = True
+                                reciclagens += 1
+                    resultados.append(resultado)
+
+                    rss = resultado.get('memoria', {}).get('rss_pico_mb', 0)
+                    if limite_memoria > 0 and rss > limite_memoria and not reciclar:
+                        print(f"Processo {resultado['memoria']['pid']} com pico de {rss:.0f} MB (limite "
+                              f"{limite_memoria:g} MB): reciclando processos de trabalho...", file=sys.stderr)
+                        reciclar = True
+                        reciclagens += 1
+
+    return resultados, reciclagens
+
+
+def cria_parser():
+    """Cria o parser de argumentos da linha de comando, com um subcomando por produto
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='python -m plotMap.cli', description='Plotagem de mapas de precipitacao.')
+
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument('entradas', nargs='*', default=['input'],
+                       help="arquivos, pastas ou padroes glob de entrada (padrao: pasta 'input')")
+    comum.add_argument('-o', '--saida', default='output',
+                       help="pasta de destino dos mapas (padrao: 'output')")
+    comum.add_argument('-f', '--formato', default='png',
+                       help="formato dos mapas, pela extensao do arquivo (padrao: 'png')")
+    comum.add_argument('-j', '--jobs', type=int, default=1,
+                       help='numero de processos de plotagem em paralelo (padrao: 1)')
+    modo = comum.add_mutually_exclusive_group()
+    modo.add_argument('--incremental', action='store_true',
+                      help='plota apenas os mapas inexistentes ou mais antigos que a entrada')
+    modo.add_argument('--forcar', action='store_true',
+                      help='plota todos os mapas (padrao)')
+    comum.add_argument('--limpar', action='store_true',
+                       help='apaga os mapas da pasta de destino (arquivos com a extensao de --formato) antes de plotar')
+    comum.add_argument('--tempos', action='store_true',
+                       help='exibe o relatorio de tempos em stderr ao final')
+    comum.add_argument('--json', metavar='ARQUIVO',
+                       help="grava o resultado em JSON no arquivo informado ('-' para stdout)")
+    comum.add_argument('--memoria', action='store_true',
+                       help='mede o pico de memoria do Python (tracemalloc) por mapa e exibe o crescimento da memoria')
+    comum.add_argument('--max-mapas-processo', type=int, default=0, metavar='N',
+                       help='substitui cada processo de trabalho apos N mapas (Python >= 3.11)')
+    comum.add_argument('--limite-memoria', type=float, default=0, metavar='MB',
+                       help='substitui os processos de trabalho quando o pico de memoria residente de algum, '
+                            'durante um mapa, ultrapassar MB')
+
+    subparsers = parser.add_subparsers(dest='produto', required=True)
+
+    for produto, descricao in (('ons', 'chuva prevista no formato ONS'),
+                               ('acc', 'chuva acumulada no formato ONS'),
+                               ('diff', 'diferencial de chuva no formato ONS')):
+        sub = subparsers.add_parser(produto, parents=[comum], help=descricao)
+        sub.add_argument('--cache', action='store_true',
+                         help="utiliza/grava o cache binario das grades (pasta '.cache' ao lado da entrada)")
+
+    sub = subparsers.add_parser('csv', parents=[comum], help='arquivo csv com colunas lon, lat e prec')
+    sub.add_argument('--titulo', default='', help='titulo do mapa')
+    sub.add_argument('--bloco', type=int, default=0,
+                     help='le o csv em blocos com esse numero de linhas')
+    sub.add_argument('--resolucao', type=float, default=0,
+                     help='reduz os dados a uma grade com esse espacamento (graus)')
+
+    return parser
+
+
+def main(argv=None):
+    """Executa a linha de comando
+
+    Args:
+        argv (list): argumentos. Se nao informados, usa sys.argv
+
+    Returns:
+        int: codigo de saida (0 se todos os mapas foram plotados sem erro)
+    """
+
+    args = cria_parser().parse_args(argv)
+
+    if args.produto == 'csv':
+        opcoes = {'caption': args.titulo, 'tamanho_bloco': args.bloco, 'resolucao': args.resolucao}
+    else:
+        opcoes = {'usar_cache': args.cache}
+
+    saida = os.path.abspath(args.saida)
+    os.makedirs(saida, exist_ok=True)
+    if args.limpar:
+        print(f"{limpa_saida(saida, args.formato)} mapa(s) .{args.formato} apagado(s) em {saida}", file=sys.stderr)
+
+    inicio = time.perf_counter()
+
+    tarefas = []
+    resultados = []
+    for entrada in expande_entradas(args.entradas):
+        destino = os.path.join(saida, os.path.splitext(os.path.basename(entrada))[0] + '.' + args.formato)
+        if args.incremental and atualizado(entrada, destino):
+            resultados.append({'produto': args.produto, 'entrada': entrada, 'destino': destino,
+                               'status': 'atualizado', 'segundos': 0.0})
+        else:
+            tarefas.append({'produto': args.produto, 'entrada': entrada, 'destino': destino,
+                            'opcoes': opcoes, 'memoria': args.memoria})
+
+    executados, reciclagens = executa_tarefas(tarefas, args.jobs, args.max_mapas_processo, args.limite_memoria)
+    resultados.extend(executados)
+
+    total = round(time.perf_counter() - inicio, 4)
+
+    # crescimento da memoria, na ordem de execucao
+    memoria = resumo_crescimento([r['memoria'] for r in executados if 'memoria' in r])
+    memoria['reciclagens'] = reciclagens
+
+    resultados.sort(key=lambda r: r['entrada'])
+    contagem = {}
+    for r in resultados:
+        contagem[r['status']] = contagem.get(r['status'], 0) + 1
+
+    if args.tempos:
+        print('\nTempo por mapa:', file=sys.stderr)
+        for r in resultados:
+            print(f"  {r['segundos']:9.3f} s  {r['status']:<12} {os.path.basename(r['entrada'])}",
+                  file=sys.stderr)
+        print(f"  {total:9.3f} s  total ({args.jobs} processo(s))", file=sys.stderr)
+
+    if args.memoria:
+        print('\nMemoria:', file=sys.stderr)
+        print(f"  RSS maximo: {memoria['rss_max_mb']:.1f} MB apos os mapas, {memoria['rss_pico_max_mb']:.1f} MB "
+              "de pico durante os mapas", file=sys.stderr)
+        if 'pico_python_max_mb' in memoria:
+            print(f"  pico do Python por mapa: {memoria['pico_python_max_mb']:.1f} MB", file=sys.stderr)
+        for pid, p in memoria['processos'].items():
+            print(f"  processo {pid}: {p['mapas']} mapa(s), {p['rss_inicial_mb']:.1f} -> {p['rss_final_mb']:.1f} MB "
+                  f"({p['crescimento_por_mapa_mb']:+.3f} MB/mapa)", file=sys.stderr)
+        if reciclagens:
+            print(f"  reciclagens dos processos de trabalho: {reciclagens}", file=sys.stderr)
+
+    for r in resultados:
+        if r['status'] == 'erro':
+            print(f"Erro ao plotar {r['entrada']}: {r['erro']}", file=sys.stderr)
+
+    if args.json:
+        relatorio = {'produto': args.produto, 'jobs': args.jobs, 'segundos': total,
+                     'contagem': contagem, 'memoria': memoria, 'mapas': resultados}
+        if args.json == '-':
+            json.dump(relatorio, sys.stdout, indent=2, ensure_ascii=False)
+            print()
+        else:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(relatorio, f, indent=2, ensure_ascii=False)
+
+    return 1 if contagem.get('erro', 0) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Estatisticas de ensembles a partir de membros no formato ONS (.dat)
+
+Calcula media, mediana, percentis, desvio padrao e probabilidade de excedencia dos limiares da escala de cores
+de um modelo de mapa, e plota os resultados com plotarMapa.
+    """
+
+import os
+import numpy as np
+from plotMap.plotMap import loadMapTemplate, plotarMapa
+from plotMap.functions import carrega_dat_ONS, listaShapes, mapTemplate
+
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Modelo de mapa para os mapas de probabilidade de excedencia (0 a 100 %).
+mapTemplateProbabilidade = os.path.join(dir_path, 'templates/ProbabilidadeONS.dat')
+
+
+def calcula_ensemble(arquivos, limiares=None, percentis=(10, 50, 90), usar_cache=False,
+                     arquivo_temporario='', linhas_bloco=64):
+    """Calcula as estatisticas de um ensemble, lendo um membro por vez
+
+    Media, desvio padrao e probabilidades de excedencia sao acumulados membro a membro (algoritmo de Welford e
+    contagens), com memoria proporcional ao tamanho de uma grade. Os percentis precisam de todos os membros: eles
+    sao empilhados em um unico array float32 (em memoria ou, com arquivo_temporario, mapeado em disco) e
+    calculados em blocos de linhas, limitando os arrays temporarios.
+
+    Args:
+        arquivos (list): arquivos .dat dos membros (mesma grade lon/lat)
+        limiares (list): limiares para a probabilidade de excedencia. Se nao informados, usa os valores da
+            barra de cores de mapTemplate
+        percentis (tuple): percentis a calcular (50 = mediana). Vazio para nao empilhar os membros
+        usar_cache (bool): utiliza/grava o cache binario das grades (ver carrega_dat_ONS)
+        arquivo_temporario (string): arquivo .npy para empilhar os membros em disco, em vez da memoria
+        linhas_bloco (int): numero de latitudes por bloco no calculo dos percentis
+
+    Raises:
+        NameError: lista vazia ou membros com grades diferentes
+
+    Returns:
+        tuple: (lons, lats, estatisticas), com estatisticas um dicionario com 'membros', 'media', 'desvio',
+            'percentis' ({percentil: grade}), 'limiares' e 'probabilidade' (limiares x latitudes x longitudes, em %)
+    """
+
+    if len(arquivos) == 0:
+        raise NameError('Nenhum membro informado para o ensemble.')
+
+    if limiares is None:
+        limiares = loadMapTemplate(mapTemplate).barraCores_valores
+    limiares = np.asarray(limiares, dtype=np.float32)
+
+    lons, lats, chuva = carrega_dat_ONS(arquivos[0], usar_cache)
+    forma = chuva.shape
+
+    # acumuladores (float64 para estabilidade numerica da media e da variancia)
+    validos = np.zeros(forma, dtype=np.int32)
+    media = np.zeros(forma, dtype=np.float64)
+    m2 = np.zeros(forma, dtype=np.float64)
+    excedencias = np.zeros((len(limiares),) + forma, dtype=np.int32)
+
+    pilha = None
+    if len(percentis) > 0:
+        if arquivo_temporario != '':
+            pilha = np.lib.format.open_memmap(arquivo_temporario, mode='w+', dtype=np.float32,
+                                              shape=(len(arquivos),) + forma)
+        else:
+            pilha = np.empty((len(arquivos),) + forma, dtype=np.float32)
+
+    for i, arquivo in enumerate(arquivos):
+
+        if i > 0:
+            lons_membro, lats_membro, chuva = carrega_dat_ONS(arquivo, usar_cache)
+            if not (np.array_equal(lons_membro, lons) and np.array_equal(lats_membro, lats)):
+                raise NameError(
+                    'O membro {} nao esta na mesma grade do primeiro membro.'.format(arquivo))
+
+        if pilha is not None:
+            pilha[i] = chuva
+
+        # atualizacao de Welford, ignorando pontos sem dado
+        ok = ~np.isnan(chuva)
+        validos += ok
+        delta = np.where(ok, chuva - media, 0)
+        media += np.where(ok, delta / np.maximum(validos, 1), 0)
+        m2 += delta * np.where(ok, chuva - media, 0)
+
+        excedencias += chuva[np.newaxis] > limiares[:, np.newaxis, np.newaxis]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        estatisticas = {
+            'membros': len(arquivos),
+            'media': np.where(validos > 0, media, np.nan).astype(np.float32),
+            'desvio': np.sqrt(m2 / np.where(validos > 1, validos - 1, np.nan)).astype(np.float32),
+            'limiares': limiares,
+            'probabilidade': (100.0 * excedencias / validos).astype(np.float32),
+            'percentis': {},
+        }
+
+    if pilha is not None:
+        resultado = np.empty((len(percentis),) + forma, dtype=np.float32)
+        for inicio in range(0, forma[0], linhas_bloco):
+            resultado[:, inicio:inicio + linhas_bloco] = percentis_membros(
+                pilha[:, inicio:inicio + linhas_bloco], percentis)
+        for p, grade in zip(percentis, resultado):
+            estatisticas['percentis'][p] = grade
+
+    return lons, lats, estatisticas
+
+
+def percentis_membros(bloco, percentis):
+    """Calcula percentis ao longo do primeiro eixo (membros), ignorando 'nan'
+
+    Equivale a np.nanpercentile com interpolacao linear, mas vetorizado: ordena os membros uma unica vez e
+    interpola pela quantidade de membros validos de cada ponto.
+
+    Args:
+        bloco (array): membros x latitudes x longitudes
+        percentis (tuple): percentis a calcular (0 a 100)
+
+    Returns:
+        array: percentis x latitudes x longitudes ('nan' nos pontos sem nenhum membro valido)
+    """
+
+    # 'nan' ficam no final da ordenacao
+    ordenado = np.sort(bloco, axis=0)
+    validos = (~np.isnan(bloco)).sum(axis=0)
+
+    resultado = np.empty((len(percentis),) + bloco.shape[1:], dtype=np.float32)
+    for k, p in enumerate(percentis):
+        posicao = np.maximum(validos - 1, 0) * (p / 100.0)
+        inferior = np.floor(posicao).astype(np.int64)
+        superior = np.minimum(inferior + 1, np.maximum(validos - 1, 0))
+        fracao = posicao - inferior
+        v_inf = np.take_along_axis(ordenado, inferior[np.newaxis], axis=0)[0]
+        v_sup = np.take_along_axis(ordenado, superior[np.newaxis], axis=0)[0]
+        resultado[k] = np.where(validos > 0, v_inf + (v_sup - v_inf) * fracao, np.nan)
+
+    return resultado
+
+
+def plotMapaEnsemble(arquivos, pasta_output='output', nome_ensemble='', limiares=None, percentis=(10, 50, 90),
+                     usar_cache=False, arquivo_temporario=''):
+    """Plota media, percentis, desvio padrao e probabilidades de excedencia de um ensemble
+
+    Os mapas de media, percentis e desvio usam mapTemplate; os de probabilidade usam mapTemplateProbabilidade.
+
+    Args:
+        arquivos (list): arquivos .dat dos membros
+        pasta_output (string): pasta de destino dos mapas
+        nome_ensemble (string): nome usado nos titulos e arquivos. Se nao informado, usa o nome do primeiro membro
+        limiares, percentis, usar_cache, arquivo_temporario: ver calcula_ensemble
+
+    Returns:
+        list: arquivos de mapa gerados
+    """
+
+    lons, lats, estatisticas = calcula_ensemble(arquivos, limiares, percentis, usar_cache, arquivo_temporario)
+
+    if nome_ensemble == '':
+        nome_ensemble = os.path.split(arquivos[0])[1].split('_')[0]
+
+    membros = estatisticas['membros']
+
+    # (sufixo do arquivo, titulo, grade, modelo de mapa)
+    mapas = [('media', 'Media', estatisticas['media'], mapTemplate),
+             ('desvio', 'Desvio padrao', estatisticas['desvio'], mapTemplate)]
+    for p, grade in estatisticas['percentis'].items():
+        mapas.append((f'p{p:g}', 'Mediana' if p == 50 else f'Percentil {p:g}', grade, mapTemplate))
+    for limiar, grade in zip(estatisticas['limiares'], estatisticas['probabilidade']):
+        mapas.append((f'prob{limiar:g}mm', f'Probabilidade de exceder {limiar:g} mm', grade,
+                      mapTemplateProbabilidade))
+
+    os.makedirs(pasta_output, exist_ok=True)
+
+    # modelos lidos uma unica vez para todos os mapas
+    modelos = {m: loadMapTemplate(m) for m in (mapTemplate, mapTemplateProbabilidade)}
+
+    renderizados = []
+    for sufixo, descricao, grade, modelo in mapas:
+
+        arquivo_destino = os.path.join(pasta_output, f'{nome_ensemble}_{sufixo}.png')
+
+        print(f"Plotando mapa {os.path.split(arquivo_destino)[1]}...")
+
+        plotarMapa(titulo=f'Ensemble {nome_ensemble} ({membros} membros)\n{descricao}',
+                   lons=lons,
+                   lats=lats,
+                   dados=grade,
+                   modeloMapa=modelos[modelo],
+                   destino=arquivo_destino,
+                   shapeFile=listaShapes
+                   )
+
+        renderizados.append(arquivo_destino)
+
+    return renderizados
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+"""
+******************************************************************************
+estatisticasBacias.py - Estatísticas zonais de grades lon/lat por bacia hidrográfica
+
+Calcula média, máxima e total de precipitação por bacia (polígonos do arquivo
+'shapes/Bacias.shp') para uma ou mais grades de uma só vez.
+
+A relação célula-bacia é construída uma única vez para cada grade lon/lat e
+mantida em memória (e, opcionalmente, em disco). As estatísticas de qualquer
+número de grades são obtidas com um único produto matricial.
+
+Licença : MIT
+Dependências: numpy, pandas e plotMap (shapely 2.0 ou superior)
+******************************************************************************
+"""
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+from plotMap.plotMap import ArquivoShape
+
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Arquivo shape padrão com as bacias hidrográficas.
+shapeBacias = os.path.join(dir_path, 'shapes/Bacias.shp')
+
+# Matrizes já construídas, indexadas pela chave da grade e do arquivo shape.
+_cacheMatrizes = {}
+
+
+# Classes
+
+class MatrizBacias:
+    """
+    Classe MatrizBacias - Relaciona as células de uma grade lon/lat às bacias de um arquivo shape.
+
+    Uma célula pertence a cada bacia que contém o seu centro, inclusive na divisa, com a mesma consulta de
+    'ArquivoShape.localizar' (ver 'ArquivoShape.localizarTodas'). Bacias sobrepostas (incrementais) compartilham
+    as células comuns. Bacias menores que uma célula recebem a célula mais próxima de um ponto interno do polígono.
+
+    Atributos
+    ---------
+    nomes : lista com o nome de cada bacia (campo 'campoNome' do arquivo 'dbf');
+
+    celulas : índices (na grade achatada) das células que pertencem a alguma bacia;
+
+    pesos : matriz (bacias x celulas) com o peso de área (cosseno da latitude) de cada célula em cada bacia;
+
+    indices, inicios : posições em 'celulas' das células de cada bacia, concatenadas, e o início de cada bacia.
+    """
+
+    def __init__(self, lons, lats, shapeFile=shapeBacias, campoNome='LAYER'):
+
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+
+        if type(shapeFile) is not ArquivoShape:
+            shapeFile = ArquivoShape(shapeFile)
+
+        self.forma = (len(lats), len(lons))
+        self.nomes = [str(atributos.get(campoNome, i))
+                      for i, atributos in enumerate(shapeFile.atributos)]
+
+        # Centros das células, na mesma ordem de 'dados.ravel()' (linhas = latitudes).
+        xs, ys = np.meshgrid(lons, lats)
+        xs = xs.ravel()
+        ys = ys.ravel()
+
+        # Pares (célula, bacia), pelo índice espacial do arquivo shape.
+        pontos, bacias = shapeFile.localizarTodas(xs, ys)
+
+        # Células de cada bacia, agrupadas por uma única ordenação.
+        ordem = np.argsort(bacias, kind='stable')
+        contagens = np.bincount(bacias, minlength=len(shapeFile.geometrias))
+        membros = np.split(pontos[ordem], np.cumsum(contagens)[:-1])
+
+        for b, geometria in enumerate(shapeFile.geometrias):
+            if membros[b].size == 0:
+                membros[b] = _celulaMaisProxima(geometria.representative_point(), lons, lats)
+
+        if sum(m.size for m in membros) == 0:
+            raise NameError("Nenhuma bacia do arquivo shape intercepta a grade informada.")
+
+        self.celulas = np.unique(np.concatenate(membros)).astype(np.int64)
+
+        # Posições de cada bacia dentro de 'celulas'.
+        posicoes = [np.searchsorted(self.celulas, m) for m in membros]
+        tamanhos = np.array([p.size for p in posicoes], dtype=np.int64)
+        self.indices = np.concatenate(posicoes).astype(np.int64)
+        self.inicios = np.concatenate(([0], np.cumsum(tamanhos)[:-1])).astype(np.int64)
+
+        # Peso de área das células (proporcional ao cosseno da latitude).
+        area = np.cos(np.deg2rad(ys[self.celulas])).astype(np.float32)
+
+        self.pesos = np.zeros((len(membros), self.celulas.size), dtype=np.float32)
+        for b, p in enumerate(posicoes):
+            self.pesos[b, p] = area[p]
+
+    def calcular(self, dados):
+        """
+        Calcula média (ponderada pela área), máxima e total por bacia.
+
+        Argumentos
+        ----------
+        dados : matriz (latitudes x longitudes) ou conjunto de matrizes (grades x latitudes x longitudes).
+            Valores 'nan' são ignorados.
+
+        Retorno
+        -------
+        Tupla (media, maxima, total, celulas), cada uma com formato (grades x bacias).
+        """
+
+        dados = np.asarray(dados, dtype=np.float32)
+        if dados.shape[-2:] != self.forma:
+            raise NameError("Formato da grade {} diferente do esperado {}.".format(
+                dados.shape[-2:], self.forma))
+
+        valores = dados.reshape(-1, self.forma[0] * self.forma[1])[:, self.celulas]
+        validos = ~np.isnan(valores)
+        preenchidos = np.where(validos, valores, np.float32(0))
+
+        pertence = (self.pesos > 0).astype(np.float32)
+
+        # Produtos matriciais (grades x celulas) @ (celulas x bacias).
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = (preenchidos @ self.pesos.T) / (validos.astype(np.float32) @ self.pesos.T)
+        total = preenchidos @ pertence.T
+        celulas = validos.astype(np.float32) @ pertence.T
+
+        # Máxima por bacia: redução por segmentos sobre as células de cada bacia.
+        # Bacias sem células na grade (fora da área coberta) recebem 'nan'.
+        vazias = np.diff(np.append(self.inicios, self.indices.size)) == 0
+        inicios = np.minimum(self.inicios, self.indices.size - 1)
+        maxima = np.fmax.reduceat(valores[:, self.indices], inicios, axis=1)
+        maxima[:, vazias] = np.nan
+
+        return(media, maxima, total, celulas.astype(np.int64))
+
+
+# Funções
+
+def obterMatrizBacias(lons, lats, shapeFile=shapeBacias, campoNome='LAYER', dirCache=''):
+    """
+    Retorna a 'MatrizBacias' da grade informada, construindo-a apenas na primeira chamada.
+
+    Argumentos
+    ----------
+    lons, lats : Listas com as longitudes e latitudes da grade;
+
+    shapeFile : (Opcional) Nome do arquivo 'shp' ou objeto 'ArquivoShape' com as bacias;
+
+    campoNome : (Opcional) Campo do arquivo 'dbf' com o nome das bacias;
+
+    dirCache : (Opcional) Pasta para gravar/ler a matriz em disco ('npz'). Se não declarada, usa apenas memória.
+
+    Retorno
+    -------
+    objeto MatrizBacias.
+    """
+
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+
+    nomeShape = shapeFile.nomeArquivo if type(shapeFile) is ArquivoShape else shapeFile
+
+    # A chave considera a grade (formato e valores de cada eixo), o campo e a data/tamanho do arquivo shape.
+    info = os.stat(nomeShape)
+    chave = hashlib.sha1()
+    for array in (lons, lats):
+        chave.update(str(array.shape).encode())
+        chave.update(np.ascontiguousarray(array).tobytes())
+    chave.update('|{}|{}|{}|{}'.format(
+        os.path.realpath(nomeShape), campoNome, info.st_mtime_ns, info.st_size).encode())
+    chave = chave.hexdigest()
+
+    if chave in _cacheMatrizes:
+        return(_cacheMatrizes[chave])
+
+    arquivoCache = os.path.join(dirCache, 'bacias_{}.npz'.format(chave)) if dirCache != '' else ''
+
+    if arquivoCache != '' and os.path.isfile(arquivoCache):
+        matriz = MatrizBacias.__new__(MatrizBacias)
+        with np.load(arquivoCache) as npz:
+            matriz.forma = tuple(int(i) for i in npz['forma'])
+            matriz.nomes = [str(n) for n in npz['nomes']]
+            matriz.celulas = npz['celulas']
+            matriz.indices = npz['indices']
+            matriz.inicios = npz['inicios']
+            matriz.pesos = npz['pesos']
+    else:
+        matriz = MatrizBacias(lons, lats, shapeFile, campoNome)
+        if arquivoCache != '':
+            os.makedirs(dirCache, exist_ok=True)
+            np.savez(arquivoCache, forma=np.array(matriz.forma), nomes=np.array(matriz.nomes),
+                     celulas=matriz.celulas, indices=matriz.indices, inicios=matriz.inicios,
+                     pesos=matriz.pesos)
+
+    _cacheMatrizes[chave] = matriz
+
+    return(matriz)
+
+
+def estatisticasBacias(lons, lats, dados, nomesGrades=None, shapeFile=shapeBacias, campoNome='LAYER',
+                       dirCache='', destino=''):
+    """
+    Calcula média, máxima e total de uma ou mais grades para cada bacia.
+
+    Argumentos
+    ----------
+    lons, lats : Listas com as longitudes e latitudes da grade;
+
+    dados : matriz (latitudes x longitudes) ou conjunto de matrizes (grades x latitudes x longitudes);
+
+    nomesGrades : (Opcional) Lista com o nome de cada grade. Se não declarada, numera as grades a partir de 0;
+
+    shapeFile, campoNome, dirCache : (Opcional) Ver 'obterMatrizBacias';
+
+    destino : (Opcional) Nome do arquivo 'csv' para exportar a tabela.
+
+    Retorno
+    -------
+    DataFrame com as colunas 'grade', 'bacia', 'media', 'maxima', 'total' e 'celulas'.
+    """
+
+    matriz = obterMatrizBacias(lons, lats, shapeFile, campoNome, dirCache)
+
+    media, maxima, total, celulas = matriz.calcular(dados)
+
+    numGrades, numBacias = media.shape
+    if nomesGrades is None:
+        nomesGrades = list(range(numGrades))
+    elif len(nomesGrades) != numGrades:
+        raise NameError("Foram informados {} nomes para {} grades.".format(
+            len(nomesGrades), numGrades))
+
+    tabela = pd.DataFrame({
+        'grade': np.repeat(np.asarray(nomesGrades, dtype=object), numBacias),
+        'bacia': np.tile(np.asarray(matriz.nomes, dtype=object), numGrades),
+        'media': media.ravel(),
+        'maxima': maxima.ravel(),
+        'total': total.ravel(),
+        'celulas': celulas.ravel(),
+    })
+
+    if destino != '':
+        tabela.to_csv(destino, index=False, float_format='%.2f')
+
+    return(tabela)
+
+
+def _celulaMaisProxima(ponto, lons, lats):
+    """
+    Retorna o índice (na grade achatada) da célula mais próxima do ponto, ou nenhum se estiver fora da grade.
+    """
+
+    i = int(np.abs(lats - ponto.y).argmin())
+    j = int(np.abs(lons - ponto.x).argmin())
+
+    # Tolerância de uma célula além dos limites da grade.
+    dlon = np.abs(np.diff(lons)).max() if len(lons) > 1 else 0
+    dlat = np.abs(np.diff(lats)).max() if len(lats) > 1 else 0
+    if abs(lons[j] - ponto.x) > dlon or abs(lats[i] - ponto.y) > dlat:
+        return(np.array([], dtype=np.int64))
+
+    return(np.array([i * len(lons) + j], dtype=np.int64))
@@ -7,7 +7,9 @@ import sys
 import numpy as np
 import struct
 import pandas as pd
-from plotMap.plotMap import ArquivoShape, plotarMapa
+from plotMap.plotMap import ArquivoShape, plotarMapa, loadMapTemplate
+from plotMap.validacao import (ErroValidacao, RelatorioValidacao, mascara_undef, valida_eixo, valida_pontos,
+                               valida_grade)
 from datetime import datetime, timedelta
 
 
@@ -190,15 +192,327 @@ def dados_Mapa_diff(arquivo_input):
     return nome_mapa, data_rodada1, data_rodada2, data_previsao_ini, data_previsao_fim
 
 
-def plotMapaCSV(arquivo_input='', arquivo_output='', caption=''):
+def carrega_csv_blocos(arquivo, tamanho_bloco=1000000, resolucao=0, retorna_relatorio=False):
+    """Le um arquivo csv (colunas lon, lat e prec) em blocos, montando a grade sem carregar o arquivo inteiro
+
+    O arquivo eh lido duas vezes, apenas com as colunas necessarias (valores em float32 e coordenadas em float64,
+    para o calculo exato das celulas): a primeira leitura monta os eixos de longitude e latitude e a segunda
+    posiciona os valores em uma grade pre-alocada pelo indice das coordenadas. O pico de memoria fica proximo do
+    tamanho da grade final mais um bloco.
+
+    Os pontos passam pelas mesmas verificacoes de validacao.valida_pontos, bloco a bloco: coordenadas invalidas,
+    valores 'undef' (mascarados antes de posicionar ou acumular), lacunas e regularidade dos eixos e pontos
+    duplicados. Com resolucao, varios pontos por celula sao esperados e os duplicados nao sao verificados.
+
+    Args:
+        arquivo (string): caminho para o arquivo csv
+        tamanho_bloco (int): numero de linhas lidas por bloco
+        resolucao (float): se maior que zero, reduz os dados a uma grade regular com esse espacamento (graus),
+            calculando a media dos pontos de cada celula
+        retorna_relatorio (bool): em vez de exibir os avisos, retorna tambem o relatorio da validacao (ver
+            carrega_dat_ONS)
+
+    Raises:
+        ErroValidacao: arquivo rejeitado na validacao
+
+    Returns:
+        tuple: arrays (lons, lats, chuva), com chuva no formato (len(lats), len(lons)) e 'nan' nos pontos ausentes.
+            Com retorna_relatorio=True, (lons, lats, chuva, relatorio)
+    """
+
+    # coordenadas em float64, para posicionar sem erro de arredondamento os pontos nas bordas das celulas
+    tipos = {'lon': np.float64, 'lat': np.float64, 'prec': np.float32}
+
+    # tolerancia (em fracao de celula) no calculo do indice da celula de cada ponto
+    tolerancia = 1e-6
+
+    relatorio = RelatorioValidacao(os.path.split(arquivo)[1])
+
+    def blocos(colunas):
+        return pd.read_csv(arquivo, usecols=colunas, dtype={c: tipos[c] for c in colunas},
+                           chunksize=tamanho_bloco)
+
+    # primeira leitura: eixos da grade (valores unicos) ou limites (grade reduzida)
+    lons = np.empty(0, dtype=np.float64)
+    lats = np.empty(0, dtype=np.float64)
+    limites = [np.inf, -np.inf, np.inf, -np.inf]
+    pontos = 0
+    invalidos = 0
+    fora = 0
+
+    with blocos(['lon', 'lat']) as leitor:
+        for bloco in leitor:
+            lon = bloco['lon'].to_numpy()
+            lat = bloco['lat'].to_numpy()
+            pontos += len(lon)
+
+            validas = np.isfinite(lon) & np.isfinite(lat)
+            invalidos += int((~validas).sum())
+            fora += int(((np.abs(lat) > 90) | (np.abs(lon) > 360)).sum())
+            lon = lon[validas]
+            lat = lat[validas]
+            if len(lon) == 0:
+                continue
+
+            if resolucao > 0:
+                limites = [min(limites[0], lon.min()), max(limites[1], lon.max()),
+                           min(limites[2], lat.min()), max(limites[3], lat.max())]
+            else:
+                lons = np.union1d(lons, lon)
+                lats = np.union1d(lats, lat)
+
+    relatorio.estatisticas['pontos'] = pontos
+    if pontos == 0:
+        relatorio.erros.append('arquivo sem pontos')
+    elif invalidos:
+        relatorio.erros.append(f"{invalidos} ponto(s) com coordenada invalida")
+    elif fora:
+        relatorio.erros.append('coordenadas fora dos limites (latitude em [-90, 90], longitude em [-360, 360])')
+    if not relatorio.ok:
+        raise ErroValidacao(relatorio)
+
+    if resolucao > 0:
+        # celulas alinhadas a multiplos da resolucao; os eixos contem os centros das celulas
+        lon0 = np.floor(limites[0] / resolucao + tolerancia) * resolucao
+        lat0 = np.floor(limites[2] / resolucao + tolerancia) * resolucao
+        nlon = int(np.floor((limites[1] - lon0) / resolucao + tolerancia)) + 1
+        nlat = int(np.floor((limites[3] - lat0) / resolucao + tolerancia)) + 1
+        lons = (lon0 + (np.arange(nlon) + 0.5) * resolucao).astype(np.float32)
+        lats = (lat0 + (np.arange(nlat) + 0.5) * resolucao).astype(np.float32)
+        soma = np.zeros(nlat * nlon, dtype=np.float64)
+        contagem = np.zeros(nlat * nlon, dtype=np.int64)
+    else:
+        valida_eixo(lons, 'longitude', relatorio)
+        valida_eixo(lats, 'latitude', relatorio)
+        chuva = np.full((len(lats), len(lons)), np.nan, dtype=np.float32)
+        # visao achatada da grade e celulas ja preenchidas, para a deteccao de duplicados entre blocos
+        plana = chuva.reshape(-1)
+        preenchidas = np.zeros(plana.size, dtype=bool)
+
+    n_undef = 0
+    n_duplicados = 0
+    n_conflitantes = 0
+
+    def iguais(a, b):
+        return (a == b) | (np.isnan(a) & np.isnan(b))
+
+    # segunda leitura: posiciona (ou acumula) os valores pelo indice das coordenadas
+    with blocos(['lon', 'lat', 'prec']) as leitor:
+        for bloco in leitor:
+            lon = bloco['lon'].to_numpy()
+            lat = bloco['lat'].to_numpy()
+            prec, n = mascara_undef(bloco['prec'].to_numpy())
+            n_undef += n
+
+            if resolucao > 0:
+                ilon = np.floor((lon - lon0) / resolucao + tolerancia).astype(np.int64)
+                ilat = np.floor((lat - lat0) / resolucao + tolerancia).astype(np.int64)
+                validos = ~np.isnan(prec)
+                indices = ilat[validos] * nlon + ilon[validos]
+                soma += np.bincount(indices, weights=prec[validos], minlength=soma.size)
+                contagem += np.bincount(indices, minlength=contagem.size)
+            else:
+                indices = np.searchsorted(lats, lat) * len(lons) + np.searchsorted(lons, lon)
+
+                # duplicados dentro do bloco
+                ordem = np.argsort(indices, kind='stable')
+                ordenados = indices[ordem]
+                valores = prec[ordem]
+                repetidos = np.zeros(len(ordenados), dtype=bool)
+                repetidos[1:] = ordenados[1:] == ordenados[:-1]
+                n_duplicados += int(repetidos.sum())
+                n_conflitantes += int((repetidos[1:] & ~iguais(valores[1:], valores[:-1])).sum())
+
+                # duplicados de pontos de blocos anteriores
+                primeiros = ordenados[~repetidos]
+                anteriores = preenchidas[primeiros]
+                n_duplicados += int(anteriores.sum())
+                n_conflitantes += int((~iguais(plana[primeiros[anteriores]],
+                                               valores[~repetidos][anteriores])).sum())
+
+                plana[indices] = prec
+                preenchidas[indices] = True
+
+    if resolucao > 0:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chuva = (soma / contagem).astype(np.float32).reshape(nlat, nlon)
+
+    relatorio.estatisticas['undef'] = n_undef
+    if n_undef:
+        relatorio.avisos.append(f"{n_undef} valor(es) 'undef' mascarado(s)")
+
+    relatorio.estatisticas['forma'] = [len(lats), len(lons)]
+    if resolucao > 0:
+        vazias = int((contagem == 0).sum())
+        relatorio.estatisticas['celulas_vazias'] = vazias
+        if vazias:
+            relatorio.avisos.append(f"{vazias} de {contagem.size} celula(s) da grade reduzida sem dados")
+    else:
+        relatorio.estatisticas['duplicados'] = n_duplicados
+        if n_conflitantes:
+            relatorio.erros.append(f"{n_conflitantes} ponto(s) duplicado(s) com valores diferentes")
+        elif n_duplicados:
+            relatorio.avisos.append(f"{n_duplicados} ponto(s) duplicado(s) com valores iguais")
+
+        ausentes = int((~preenchidas).sum())
+        relatorio.estatisticas['ausentes'] = ausentes
+        if ausentes:
+            relatorio.avisos.append(f"{ausentes} de {plana.size} ponto(s) da grade ausente(s) "
+                                    f"({100.0 * ausentes / plana.size:.1f}%)")
+
+    if np.isnan(chuva).all():
+        relatorio.erros.append('grade sem nenhum valor valido')
+
+    if not relatorio.ok:
+        raise ErroValidacao(relatorio)
+    if relatorio.avisos and not retorna_relatorio:
+        print(relatorio)
+
+    if retorna_relatorio:
+        return lons, lats, chuva, relatorio
+    return lons, lats, chuva
+
+
+def caminho_cache(arquivo_input):
+    """Retorna o caminho do cache binario (npz) de um arquivo de entrada, na pasta '.cache' ao lado do arquivo
+
+    Args:
+        arquivo_input (string): caminho para o arquivo
+    """
+
+    pasta, nome_arquivo = os.path.split(os.path.abspath(arquivo_input))
+    return os.path.join(pasta, '.cache', nome_arquivo + '.npz')
+
+
+def carrega_dat_ONS(arquivo_input, usar_cache=False, retorna_relatorio=False):
+    """Le um arquivo .dat no formato ONS (colunas lon, lat e valor separadas por espacos) e monta a grade
+
+    Com usar_cache=True, a grade lida eh gravada em um cache binario (ver caminho_cache) com os eixos, os valores em
+    float32 e os metadados do nome do arquivo. As leituras seguintes usam o cache enquanto a data de modificacao e o
+    tamanho do arquivo texto forem os mesmos, sem interpretar o texto novamente.
+
+    Os pontos sao validados antes de montar a grade (ver validacao.valida_pontos): valores 'undef' viram nan e
+    os avisos sao exibidos na leitura do arquivo texto.
+
+    Args:
+        arquivo_input (string): caminho para o arquivo
+        usar_cache (bool): utiliza/grava o cache binario
+        retorna_relatorio (bool): em vez de exibir os avisos, retorna tambem o relatorio da validacao, para ser
+            completado na validacao contra o modelo de mapa (ver valida_para_plotagem)
+
+    Raises:
+        NameError: erro ao abrir ou interpretar o arquivo
+        ErroValidacao: arquivo rejeitado na validacao
+
+    Returns:
+        tuple: arrays (lons, lats, chuva), com chuva no formato (len(lats), len(lons)). Com retorna_relatorio=True,
+            (lons, lats, chuva, relatorio), com relatorio None se a grade vier do cache
+    """
+
+    try:
+        info = os.stat(arquivo_input)
+    except OSError:
+        raise NameError(
+            'Erro ao tentar abrir/acessar arquivo: {}'.format(arquivo_input))
+
+    arquivo_cache = caminho_cache(arquivo_input)
+
+    if usar_cache and os.path.isfile(arquivo_cache):
+        try:
+            with np.load(arquivo_cache) as npz:
+                if int(npz['mtime']) == info.st_mtime_ns and int(npz['tamanho']) == info.st_size:
+                    if retorna_relatorio:
+                        return npz['lons'], npz['lats'], npz['chuva'], None
+                    return npz['lons'], npz['lats'], npz['chuva']
+        except (OSError, ValueError, KeyError):
+            # cache corrompido ou incompativel: le novamente o arquivo texto
+            pass
+
+    # abre arquivo e salva em dataframe
+    try:
+        df = pd.read_csv(arquivo_input, header=None, sep=r'\s+',
+                         names=['lon', 'lat', 'mm'], dtype=np.float32)
+    except:
+        raise NameError(
+            'Erro ao tentar abrir/acessar arquivo: {}'.format(arquivo_input))
+
+    # valida os pontos (undef, duplicados, lacunas e regularidade) e monta a grade pelo indice das coordenadas
+    relatorio, lons, lats, chuva = valida_pontos(df['lon'].to_numpy(), df['lat'].to_numpy(), df['mm'].to_numpy(),
+                                                 origem=os.path.split(arquivo_input)[1])
+    if not relatorio.ok:
+        raise ErroValidacao(relatorio)
+    if relatorio.avisos and not retorna_relatorio:
+        print(relatorio)
+
+    if usar_cache:
+        nome_arquivo = os.path.split(arquivo_input)[1]
+        partes = os.path.splitext(nome_arquivo)[0].split('_')
+        try:
+            os.makedirs(os.path.dirname(arquivo_cache), exist_ok=True)
+            # grava em arquivo temporario e renomeia, para nao deixar cache incompleto
+            temporario = arquivo_cache + '.tmp'
+            with open(temporario, 'wb') as f:
+                np.savez(f, lons=lons, lats=lats, chuva=chuva,
+                         mtime=np.int64(info.st_mtime_ns), tamanho=np.int64(info.st_size),
+                         nome_mapa=partes[0], datas=partes[1] if len(partes) > 1 else '')
+            os.replace(temporario, arquivo_cache)
+        except OSError:
+            print(f"Nao foi possivel gravar o cache do arquivo {nome_arquivo}.")
+
+    if retorna_relatorio:
+        return lons, lats, chuva, relatorio
+    return lons, lats, chuva
+
+
+def valida_para_plotagem(arquivo_input, lons, lats, chuva, modelo_mapa, relatorio=None):
+    """Valida a grade contra o modelo de mapa antes da plotagem (ver validacao.valida_grade)
+
+    O relatorio (da leitura, se informado, completado com a validacao contra o modelo) eh exibido uma unica vez.
+
+    Args:
+        arquivo_input (string): caminho para o arquivo de origem
+        lons, lats, chuva (array): eixos e grade
+        modelo_mapa (Mapa): modelo de mapa
+        relatorio (RelatorioValidacao): relatorio da validacao dos pontos na leitura do arquivo (ver valida_pontos)
+
+    Raises:
+        ErroValidacao: grade rejeitada na validacao
+
+    Returns:
+        array: grade com os valores 'undef' substituidos por nan
+    """
+
+    relatorio, chuva = valida_grade(lons, lats, chuva, modelo_mapa, origem=os.path.split(arquivo_input)[1],
+                                    relatorio=relatorio)
+    if not relatorio.ok:
+        raise ErroValidacao(relatorio)
+    if relatorio.avisos:
+        print(relatorio)
+
+    return chuva
+
+
+def plotMapaCSV(arquivo_input='', arquivo_output='', caption='', tamanho_bloco=0, resolucao=0, limpa_output=True):
     """Plota mapa a partir de arquivo csv
 
+    Args:
+        tamanho_bloco (int): se maior que zero, le o csv em blocos com esse numero de linhas
+            (ver carrega_csv_blocos). Recomendado para arquivos muito grandes.
+        resolucao (float): se maior que zero, reduz os dados a uma grade com esse espacamento (graus).
+            Implica leitura em blocos.
+        limpa_output (bool): apaga os arquivos antigos da pasta 'output' antes de plotar
+
     Raises:
         NameError: [description]
+        ErroValidacao: arquivo rejeitado na validacao (ver validacao.valida_pontos)
+
+    Returns:
+        list: arquivos de mapa gerados
     """
 
     # apaga arquivos antigos na pasta de output
-    deleta_arquivos('output')
+    if limpa_output:
+        deleta_arquivos('output')
 
     # se nao for informado um arquivo de entrada, serao considerados os arquivos constantes da pasta 'input'
     if arquivo_input == '':
@@ -206,36 +520,40 @@ def plotMapaCSV(arquivo_input='', arquivo_output='', caption=''):
     else:
         lista_arquivos = [arquivo_input]
 
-    for arquivo in lista_arquivos:
+    # modelo de mapa, lido uma unica vez para validacao e plotagem
+    modelo_mapa = loadMapTemplate(mapTemplate)
 
-        # abre arquivo e salva em dataframe
-        try:
-            df = pd.read_csv(arquivo)
-        except:
-            raise NameError(
-                'Erro ao tentar abrir/acessar arquivo: {}'.format(arquivo))
-
-        # sorting requerido pelo modulo de plotagem
-        df = df.sort_values(['lat', 'lon'])
-
-        # colunas para listas
-        lons = df['lon'].tolist()
-        lats = df['lat'].tolist()
-        chuva = df['prec'].tolist()
+    # mapas gerados
+    renderizados = []
 
-        # remove duplicados das listas de lon e lat. Soh eh necessario inputar as listas de latitude e longitude.
-        # A funcao plotarmapa se encarrega de fazer a combinacao das series
-        lons = list(dict.fromkeys(lons))
-        lats = list(dict.fromkeys(lats))
+    for arquivo in lista_arquivos:
 
-        # Converte listas de lon e lat em arrays numpy
-        lons = np.array(lons, dtype=float)
-        lats = np.array(lats, dtype=float)
+        # leitura em blocos, sem carregar o arquivo inteiro na memoria
+        if tamanho_bloco > 0 or resolucao > 0:
+            try:
+                lons, lats, chuva, relatorio = carrega_csv_blocos(
+                    arquivo, tamanho_bloco if tamanho_bloco > 0 else 1000000, resolucao, retorna_relatorio=True)
+            except (OSError, ValueError, KeyError):
+                raise NameError(
+                    'Erro ao tentar abrir/acessar arquivo: {}'.format(arquivo))
 
-        # Transforma a lista 'chuva' em uma matriz e altera o seu 'formato' para compatibilidade com o número de longitudes
-        # e latitudes. Veja o método 'reshape' do 'numpy' para maiores detalhes.
-        chuva = np.array(chuva, dtype=float)
-        chuva = np.reshape(chuva, (len(lats), -1))
+        else:
+            # abre arquivo e salva em dataframe
+            try:
+                df = pd.read_csv(arquivo)
+                lon, lat, prec = (df[c].to_numpy(dtype=float) for c in ('lon', 'lat', 'prec'))
+            except:
+                raise NameError(
+                    'Erro ao tentar abrir/acessar arquivo: {}'.format(arquivo))
+
+            # valida os pontos (undef, duplicados, lacunas e regularidade) e monta a grade pelo indice das
+            # coordenadas, sem depender da ordem das linhas nem de todas as linhas estarem presentes
+            relatorio, lons, lats, chuva = valida_pontos(lon, lat, prec, origem=os.path.split(arquivo)[1])
+            if not relatorio.ok:
+                raise ErroValidacao(relatorio)
+
+        # valida a grade antes do custo de criacao da figura
+        chuva = valida_para_plotagem(arquivo, lons, lats, chuva, modelo_mapa, relatorio)
 
         # define o nome do arquivo de output
         if arquivo_output == '':
@@ -250,21 +568,33 @@ def plotMapaCSV(arquivo_input='', arquivo_output='', caption=''):
                    lons=lons,
                    lats=lats,
                    dados=chuva,
-                   modeloMapa=mapTemplate,
+                   modeloMapa=modelo_mapa,
                    destino=arquivo_destino,
                    shapeFile=listaShapes
                    )
 
+        renderizados.append(arquivo_destino)
+
+    return renderizados
 
-def plotMapaONS(arquivo_input='', arquivo_output=''):
+
+def plotMapaONS(arquivo_input='', arquivo_output='', usar_cache=False, limpa_output=True):
     """Plota mapa a partir de arquivos .dat no formato ONS
 
+    Args:
+        usar_cache (bool): utiliza/grava o cache binario da grade (ver carrega_dat_ONS)
+        limpa_output (bool): apaga os arquivos antigos da pasta 'output' antes de plotar
+
     Raises:
         NameError: [description]
+
+    Returns:
+        list: arquivos de mapa gerados
     """
 
     # apaga arquivos antigos na pasta de output
-    deleta_arquivos('output')
+    if limpa_output:
+        deleta_arquivos('output')
 
     # se nao for informado um arquivo de entrada, serao considerados os arquivos constantes da pasta 'input'
     if arquivo_input == '':
@@ -272,6 +602,12 @@ def plotMapaONS(arquivo_input='', arquivo_output=''):
     else:
         lista_arquivos = [arquivo_input]
 
+    # modelo de mapa, lido uma unica vez para validacao e plotagem
+    modelo_mapa = loadMapTemplate(mapTemplate)
+
+    # mapas gerados
+    renderizados = []
+
     for arquivo in lista_arquivos:
 
         # verifica se o arquivo esta no formato correto, do contrario vai para o proximo
@@ -283,40 +619,15 @@ def plotMapaONS(arquivo_input='', arquivo_output=''):
             nome_mapa, data_rodada, data_previsao_ini, data_previsao_fim = dados_Mapa(
                 arquivo)
 
-        # abre arquivo e salva em dataframe
-        try:
-            df = pd.read_csv(arquivo, header=None, delim_whitespace=True)
-        except:
-            raise NameError(
-                'Erro ao tentar abrir/acessar arquivo: {}'.format(arquivo))
-
-        # nomeia colunas
-        df.columns = ['lon', 'lat', 'mm']
-        # sorting requerido pelo modulo de plotagem
-        df = df.sort_values(['lat', 'lon'])
-
-        # colunas para listas
-        lons = df['lon'].tolist()
-        lats = df['lat'].tolist()
-        chuva = df['mm'].tolist()
-
-        # remove duplicados das listas de lon e lat. Soh eh necessario inputar as listas de latitude e longitude.
-        # A funcao plotarmapa se encarrega de fazer a combinacao das series
-        lons = list(dict.fromkeys(lons))
-        lats = list(dict.fromkeys(lats))
-
-        # Converte listas de lon e lat em arrays numpy
-        lons = np.array(lons, dtype=float)
-        lats = np.array(lats, dtype=float)
-
-        # Transforma a lista 'chuva' em uma matriz e altera o seu 'formato' para compatibilidade com a o número de longitudes
-        # e latitudes. Veja o método 'reshape' do 'numpy' para maiores detalhes.
-        chuva = np.array(chuva, dtype=float)
-        chuva = np.reshape(chuva, (len(lats), -1))
+        # le o arquivo (ou o seu cache binario) e monta a grade
+        lons, lats, chuva, relatorio = carrega_dat_ONS(arquivo, usar_cache, retorna_relatorio=True)
 
         # Define o titulo do mapa a partir do nome do arquivo ONS (nomemapa_pDDMMYYaDDMMYY.dat)
         titulo_mapa = f'Modelo {nome_mapa}\nPrecipitacao entre 12Z {data_previsao_ini} ate 12Z {data_previsao_fim}\nPrevisao das 00Z do dia {data_rodada}'
 
+        # valida a grade antes do custo de criacao da figura
+        chuva = valida_para_plotagem(arquivo, lons, lats, chuva, modelo_mapa, relatorio)
+
         # define o nome do arquivo de output
         if arquivo_output == '':
             arquivo_destino = 'output/' + \
@@ -330,21 +641,33 @@ def plotMapaONS(arquivo_input='', arquivo_output=''):
                    lons=lons,
                    lats=lats,
                    dados=chuva,
-                   modeloMapa=mapTemplate,
+                   modeloMapa=modelo_mapa,
                    destino=arquivo_destino,
                    shapeFile=listaShapes
                    )
 
+        renderizados.append(arquivo_destino)
+
+    return renderizados
 
-def plotMapaONS_acc(arquivo_input='', arquivo_output=''):
+
+def plotMapaONS_acc(arquivo_input='', arquivo_output='', usar_cache=False, limpa_output=True):
     """Plota mapa a partir de arquivos .dat de chuva acumulada no formato ONS
 
+    Args:
+        usar_cache (bool): utiliza/grava o cache binario da grade (ver carrega_dat_ONS)
+        limpa_output (bool): apaga os arquivos antigos da pasta 'output' antes de plotar
+
     Raises:
         NameError: [description]
+
+    Returns:
+        list: arquivos de mapa gerados
     """
 
     # apaga arquivos antigos na pasta de output
-    deleta_arquivos('output')
+    if limpa_output:
+        deleta_arquivos('output')
 
     # se nao for informado um arquivo de entrada, serao considerados os arquivos constantes da pasta 'input'
     if arquivo_input == '':
@@ -352,6 +675,12 @@ def plotMapaONS_acc(arquivo_input='', arquivo_output=''):
     else:
         lista_arquivos = [arquivo_input]
 
+    # modelo de mapa, lido uma unica vez para validacao e plotagem
+    modelo_mapa = loadMapTemplate(mapTemplate)
+
+    # mapas gerados
+    renderizados = []
+
     for arquivo in lista_arquivos:
 
         # verifica se o arquivo esta no formato correto, do contrario vai para o proximo
@@ -363,40 +692,15 @@ def plotMapaONS_acc(arquivo_input='', arquivo_output=''):
             nome_mapa, data_rodada, data_previsao_ini, data_previsao_fim = dados_Mapa_acc(
                 arquivo)
 
-        # abre arquivo e salva em dataframe
-        try:
-            df = pd.read_csv(arquivo, header=None, delim_whitespace=True)
-        except:
-            raise NameError(
-                'Erro ao tentar abrir/acessar arquivo: {}'.format(arquivo))
-
-        # nomeia colunas
-        df.columns = ['lon', 'lat', 'mm']
-        # sorting requerido pelo modulo de plotagem
-        df = df.sort_values(['lat', 'lon'])
-
-        # colunas para listas
-        lons = df['lon'].tolist()
-        lats = df['lat'].tolist()
-        chuva = df['mm'].tolist()
-
-        # remove duplicados das listas de lon e lat. Soh eh necessario inputar as listas de latitude e longitude.
-        # A funcao plotarmapa se encarrega de fazer a combinacao das series
-        lons = list(dict.fromkeys(lons))
-        lats = list(dict.fromkeys(lats))
-
-        # Converte listas de lon e lat em arrays numpy
-        lons = np.array(lons, dtype=float)
-        lats = np.array(lats, dtype=float)
-
-        # Transforma a lista 'chuva' em uma matriz e altera o seu 'formato' para compatibilidade com a o número de longitudes
-        # e latitudes. Veja o método 'reshape' do 'numpy' para maiores detalhes.
-        chuva = np.array(chuva, dtype=float)
-        chuva = np.reshape(chuva, (len(lats), -1))
+        # le o arquivo (ou o seu cache binario) e monta a grade
+        lons, lats, chuva, relatorio = carrega_dat_ONS(arquivo, usar_cache, retorna_relatorio=True)
 
         # Define o titulo do mapa a partir do nome do arquivo ONS (nomemapa_pDDMMYYaDDMMYY.dat)
         titulo_mapa = f'Modelo {nome_mapa}\nPrecipitacao entre 12Z {data_previsao_ini} ate 12Z {data_previsao_fim}\nPrevisao das 00Z do dia {data_rodada}'
 
+        # valida a grade antes do custo de criacao da figura
+        chuva = valida_para_plotagem(arquivo, lons, lats, chuva, modelo_mapa, relatorio)
+
         # define o nome do arquivo de output
         if arquivo_output == '':
             arquivo_destino = 'output/' + \
@@ -410,21 +714,33 @@ def plotMapaONS_acc(arquivo_input='', arquivo_output=''):
                    lons=lons,
                    lats=lats,
                    dados=chuva,
-                   modeloMapa=mapTemplate,
+                   modeloMapa=modelo_mapa,
                    destino=arquivo_destino,
                    shapeFile=listaShapes
                    )
 
+        renderizados.append(arquivo_destino)
 
-def plotMapaONS_diff(arquivo_input='', arquivo_output=''):
+    return renderizados
+
+
+def plotMapaONS_diff(arquivo_input='', arquivo_output='', usar_cache=False, limpa_output=True):
     """Plota mapa a partir de arquivos .dat de diferencial de chuva no formato ONS
 
+    Args:
+        usar_cache (bool): utiliza/grava o cache binario da grade (ver carrega_dat_ONS)
+        limpa_output (bool): apaga os arquivos antigos da pasta 'output' antes de plotar
+
     Raises:
         NameError: [description]
+
+    Returns:
+        list: arquivos de mapa gerados
     """
 
     # apaga arquivos antigos na pasta de output
-    deleta_arquivos('output')
+    if limpa_output:
+        deleta_arquivos('output')
 
     # se nao for informado um arquivo de entrada, serao considerados os arquivos constantes da pasta 'input'
     if arquivo_input == '':
@@ -432,6 +748,12 @@ def plotMapaONS_diff(arquivo_input='', arquivo_output=''):
     else:
         lista_arquivos = [arquivo_input]
 
+    # modelo de mapa, lido uma unica vez para validacao e plotagem
+    modelo_mapa = loadMapTemplate(mapTemplate2)
+
+    # mapas gerados
+    renderizados = []
+
     for arquivo in lista_arquivos:
 
         # verifica se o arquivo esta no formato correto, do contrario vai para o proximo
@@ -443,40 +765,15 @@ def plotMapaONS_diff(arquivo_input='', arquivo_output=''):
             nome_mapa, data_rodada1, data_rodada2, data_previsao_ini, data_previsao_fim = dados_Mapa_diff(
                 arquivo)
 
-        # abre arquivo e salva em dataframe
-        try:
-            df = pd.read_csv(arquivo, header=None, delim_whitespace=True)
-        except:
-            raise NameError(
-                'Erro ao tentar abrir/acessar arquivo: {}'.format(arquivo))
-
-        # nomeia colunas
-        df.columns = ['lon', 'lat', 'mm']
-        # sorting requerido pelo modulo de plotagem
-        df = df.sort_values(['lat', 'lon'])
-
-        # colunas para listas
-        lons = df['lon'].tolist()
-        lats = df['lat'].tolist()
-        chuva = df['mm'].tolist()
-
-        # remove duplicados das listas de lon e lat. Soh eh necessario inputar as listas de latitude e longitude.
-        # A funcao plotarmapa se encarrega de fazer a combinacao das series
-        lons = list(dict.fromkeys(lons))
-        lats = list(dict.fromkeys(lats))
-
-        # Converte listas de lon e lat em arrays numpy
-        lons = np.array(lons, dtype=float)
-        lats = np.array(lats, dtype=float)
-
-        # Transforma a lista 'chuva' em uma matriz e altera o seu 'formato' para compatibilidade com a o número de longitudes
-        # e latitudes. Veja o método 'reshape' do 'numpy' para maiores detalhes.
-        chuva = np.array(chuva, dtype=float)
-        chuva = np.reshape(chuva, (len(lats), -1))
+        # le o arquivo (ou o seu cache binario) e monta a grade
+        lons, lats, chuva, relatorio = carrega_dat_ONS(arquivo, usar_cache, retorna_relatorio=True)
 
         # Define o titulo do mapa a partir do nome do arquivo ONS (nomemapa_pDDMMYYaDDMMYY.dat)
         titulo_mapa = f'Modelo {nome_mapa}\nAnomalia % entre 12Z {data_previsao_ini} ate 12Z {data_previsao_fim}\nPrevisoes das 00Z do dia {data_rodada1} vs dia {data_rodada2}'
 
+        # valida a grade antes do custo de criacao da figura
+        chuva = valida_para_plotagem(arquivo, lons, lats, chuva, modelo_mapa, relatorio)
+
         # define o nome do arquivo de output
         if arquivo_output == '':
             arquivo_destino = 'output/' + \
@@ -490,11 +787,15 @@ def plotMapaONS_diff(arquivo_input='', arquivo_output=''):
                    lons=lons,
                    lats=lats,
                    dados=chuva,
-                   modeloMapa=mapTemplate2,
+                   modeloMapa=modelo_mapa,
                    destino=arquivo_destino,
                    shapeFile=listaShapes
                    )
 
+        renderizados.append(arquivo_destino)
+
+    return renderizados
+
 
 if __name__ == '__main__':
     plotMapaONS()
@@ -0,0 +1,166 @@
+"""Medicao e liberacao de memoria para execucoes longas (lotes e servicos)
+
+Mede, para cada mapa, a memoria residente (RSS) do processo, inclusive o pico durante o mapa (amostrado em uma
+thread), e, opcionalmente, o pico de memoria alocada pelo Python (tracemalloc). Tambem libera figuras e caches apos cada mapa e resume o crescimento da memoria ao longo
+da execucao.
+    """
+
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import matplotlib.pyplot as plt
+from plotMap.plotMap import limparCacheContornos
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_mb():
+    """Retorna a memoria residente (RSS) atual do processo, em MB
+
+    Usa o psutil, se instalado; do contrario, /proc/self/statm (Linux). Em ultimo caso, retorna o pico de RSS
+    informado pelo modulo resource, ou 0 se nenhuma fonte estiver disponivel.
+    """
+
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KB no Linux, bytes no macOS
+        return pico / 2**20 if sys.platform == 'darwin' else pico / 2**10
+    except ImportError:
+        return 0.0
+
+
+def libera_memoria(limpar_caches=True):
+    """Fecha todas as figuras, descarta os contornos em cache e executa o coletor de lixo
+
+    Args:
+        limpar_caches (bool): descarta tambem o cache de contornos em memoria (ver plotMap.plotarContornos)
+    """
+
+    plt.close('all')
+    if limpar_caches:
+        limparCacheContornos()
+    gc.collect()
+
+
+class MedidaMemoria:
+    """Mede tempo e memoria de um trecho de codigo (um mapa), liberando a memoria ao final
+
+    O pico de RSS eh obtido por amostragem, em uma thread que le o RSS do processo a cada 'intervalo' segundos
+    enquanto o trecho eh executado. O tracemalloc, se iniciado aqui, eh encerrado ao final do trecho.
+
+    Uso:
+        with MedidaMemoria(rastrear=True) as medida:
+            plotMapaONS(...)
+        medida.para_dict()
+
+    Attributes:
+        rss_antes, rss_depois (float): RSS do processo antes e depois do trecho (MB), ja com a memoria liberada
+        rss_pico (float): maior RSS amostrado durante o trecho (MB)
+        pico_python (float): pico de memoria alocada pelo Python no trecho (MB); None se rastrear=False
+        segundos (float): duracao do trecho
+    """
+
+    def __init__(self, rastrear=False, limpar_caches=True, intervalo=0.05):
+        self.rastrear = rastrear
+        self.limpar_caches = limpar_caches
+        self.intervalo = intervalo
+        self.rss_antes = 0.0
+        self.rss_depois = 0.0
+        self.rss_pico = 0.0
+        self.pico_python = None
+        self.segundos = 0.0
+        self._iniciou_tracemalloc = False
+        self._parar = threading.Event()
+        self._amostrador = None
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            self.rss_pico = max(self.rss_pico, rss_mb())
+
+    def __enter__(self):
+        if self.rastrear:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._iniciou_tracemalloc = True
+            tracemalloc.reset_peak()
+        self.rss_antes = rss_mb()
+        self.rss_pico = self.rss_antes
+        self._parar.clear()
+        self._amostrador = threading.Thread(target=self._amostrar, name='MedidaMemoria', daemon=True)
+        self._amostrador.start()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.segundos = time.perf_counter() - self._inicio
+        self._parar.set()
+        self._amostrador.join()
+        # ultima amostra antes da liberacao da memoria
+        self.rss_pico = max(self.rss_pico, rss_mb())
+        if self.rastrear:
+            self.pico_python = tracemalloc.get_traced_memory()[1] / 2**20
+            if self._iniciou_tracemalloc:
+                tracemalloc.stop()
+                self._iniciou_tracemalloc = False
+        libera_memoria(self.limpar_caches)
+        self.rss_depois = rss_mb()
+        return False
+
+    def para_dict(self):
+        """Retorna as medidas como dicionario (por exemplo, para saida em JSON)"""
+        medidas = {'pid': os.getpid(), 'rss_antes_mb': round(self.rss_antes, 2),
+                   'rss_pico_mb': round(self.rss_pico, 2), 'rss_depois_mb': round(self.rss_depois, 2)}
+        if self.pico_python is not None:
+            medidas['pico_python_mb'] = round(self.pico_python, 2)
+        return medidas
+
+
+def resumo_crescimento(medidas):
+    """Resume o crescimento da memoria residente por processo ao longo de uma execucao
+
+    Args:
+        medidas (list): dicionarios de MedidaMemoria.para_dict, na ordem de execucao
+
+    Returns:
+        dict: RSS maximo (apos cada mapa e de pico), pico do Python e, para cada processo, numero de mapas,
+            RSS inicial/final e crescimento medio por mapa (MB)
+    """
+
+    processos = {}
+    for m in medidas:
+        processos.setdefault(m['pid'], []).append(m['rss_depois_mb'])
+
+    resumo = {'rss_max_mb': max((m['rss_depois_mb'] for m in medidas), default=0.0),
+              'rss_pico_max_mb': max((m.get('rss_pico_mb', 0.0) for m in medidas), default=0.0),
+              'processos': {}}
+
+    picos = [m['pico_python_mb'] for m in medidas if 'pico_python_mb' in m]
+    if picos:
+        resumo['pico_python_max_mb'] = max(picos)
+
+    for pid, serie in processos.items():
+        resumo['processos'][str(pid)] = {
+            'mapas': len(serie),
+            'rss_inicial_mb': serie[0],
+            'rss_final_mb': serie[-1],
+            'crescimento_por_mapa_mb': round((serie[-1] - serie[0]) / (len(serie) - 1), 3) if len(serie) > 1 else 0.0,
+        }
+
+    return resumo
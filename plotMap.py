@@ -5,22 +5,60 @@
 plotMap.py - Módulo para auxiliar na plotagem de mapas com dados
 
 Autor   : Nelson Rossi Bittencourt
-Versão  : 0.132
+Versão  : 0.140
 Licença : MIT
-Dependências: matplotlib e cartopy
+Dependências: matplotlib, cartopy, numpy e shapely
 ******************************************************************************
 """
 
 import matplotlib as mpl
+import matplotlib.contour
 import matplotlib.pyplot as plt
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import shapely
 import cartopy
 import cartopy.crs as ccrs
 from cartopy.io.shapereader import Reader
 from cartopy.feature import ShapelyFeature
 
+try:
+    from contourpy import __version__ as versaoContourpy
+except ImportError:
+    # matplotlib < 3.6, sem o contourpy
+    versaoContourpy = ''
+
 # TODO: implementar as demais características do mapa.
 
 
+# Camadas do Natural Earth aceitas em 'mapa_camadas' e o nome correspondente em 'cartopy.feature'.
+camadasMapa = {'land': 'LAND', 'ocean': 'OCEAN', 'coastline': 'COASTLINE', 'borders': 'BORDERS',
+               'lakes': 'LAKES', 'rivers': 'RIVERS', 'states': 'STATES'}
+
+# Resoluções do Natural Earth aceitas em 'mapa_resolucao'.
+resolucoesMapa = ('110m', '50m', '10m')
+
+# Chaves do formato de template versão 1 (todas obrigatórias).
+_chavesTemplateV1 = {'mapa_coordenadas', 'mapa_tipo', 'barra_cores_orientacao', 'barra_cores_posicao',
+                     'barra_cores_valores', 'barra_cores_codigos', 'barra_cores_corMinimo',
+                     'barra_cores_corMaximo', 'barra_cores_dist', 'barra_cores_tam', 'barra_cores_titulo'}
+
+# Chaves adicionais (opcionais) do formato de template versão 2.
+_chavesTemplateV2 = {'mapa_versao', 'figura_dpi', 'figura_tamanho', 'mapa_camadas', 'mapa_resolucao',
+                     'mapa_grade', 'mapa_rasterizar', 'xy_tamanho_marcador', 'saida_compressao'}
+
+# Cache de contornos (ver 'plotarContornos'): polígonos indexados pela chave da grade, em ordem de uso.
+_cacheContornos = OrderedDict()
+_tamanhoCacheContornos = 32
+_pastaCacheContornos = ''
+
+# Camadas já instanciadas, indexadas por (nome, resolução), para reaproveitamento entre mapas.
+_cacheCamadas = {}
+
+
 # Classes
 
 class Mapa:
@@ -48,6 +86,18 @@ class Mapa:
         self.barraCores_dist = 0
         self.barraCores_tam = 0
 
+        # Parâmetros de renderização (formato de template versão 2).
+        # Os valores padrão reproduzem o comportamento dos templates da versão 1.
+        self.mapa_versao = 1
+        self.figura_dpi = 100
+        self.figura_tamanho = [5, 5]
+        self.mapa_camadas = ['land', 'coastline', 'borders']
+        self.mapa_resolucao = '110m'
+        self.mapa_grade = True
+        self.mapa_rasterizar = False
+        self.xy_tamanhoMarcador = 50
+        self.saida_compressao = -1
+
 
 class ArquivoShape:
     """
@@ -58,12 +108,129 @@ class ArquivoShape:
     Esta classe permite que um mesmo arquivo shape seja utilizado em diversos mapas, sem o overhead causado
     pela leitura do arquivo diversas vezes.
 
+    As geometrias e os atributos (arquivo 'dbf') de cada registro ficam disponíveis em 'geometrias' e 'atributos',
+    na mesma ordem, para uso em consultas espaciais (ver módulo 'estatisticasBacias' e os métodos 'localizar' e
+    'localizarTodas').
+
+    O índice espacial ('STRtree') usado nas consultas é construído apenas na primeira consulta e mantido junto
+    com as geometrias, de modo que todas as consultas seguintes sobre o mesmo objeto o reaproveitam.
+
     """
 
     def __init__(self, nomeArquivo, corFace='none', corLinha='gray', espLinha=0.5):
-        self.shape_feature = ShapelyFeature(Reader(nomeArquivo).geometries(), ccrs.PlateCarree(),
+        self.nomeArquivo = nomeArquivo
+
+        # Registros sem geometria são descartados.
+        registros = [r for r in Reader(nomeArquivo).records() if r.geometry is not None]
+        self.geometrias = [r.geometry for r in registros]
+        self.atributos = [r.attributes for r in registros]
+
+        self.shape_feature = ShapelyFeature(self.geometrias, ccrs.PlateCarree(),
                                             facecolor=corFace, edgecolor=corLinha, linewidth=espLinha,)
 
+        # Índice espacial, construído sob demanda (ver 'indice').
+        self._indice = None
+
+    @property
+    def indice(self):
+        """
+        Índice espacial ('shapely.STRtree') sobre as geometrias do arquivo, construído na primeira utilização.
+        """
+
+        if self._indice is None:
+            # Geometrias preparadas aceleram os testes ponto-em-polígono repetidos.
+            shapely.prepare(self.geometrias)
+            self._indice = shapely.STRtree(self.geometrias)
+
+        return(self._indice)
+
+    def localizarTodas(self, lons, lats):
+        """
+        Identifica todos os pares (ponto, geometria) em que a geometria contém o ponto, inclusive na divisa.
+
+        A consulta é feita de uma só vez para todos os pontos, utilizando o índice espacial. Um ponto pode
+        pertencer a mais de uma geometria (geometrias sobrepostas, como bacias incrementais, ou divisas).
+        Requer shapely 2.0 ou superior.
+
+        Argumentos
+        ----------
+        lons : Lista ou array com as longitudes dos pontos;
+
+        lats : Lista ou array com as latitudes dos pontos.
+
+        Retorno
+        -------
+        Tupla (pontos, geometrias) com os índices de cada par, ordenados por ponto e, em seguida, por geometria.
+        """
+
+        lons = np.asarray(lons, dtype=float).ravel()
+        lats = np.asarray(lats, dtype=float).ravel()
+
+        if lons.shape != lats.shape:
+            raise NameError("As listas de longitudes ({}) e latitudes ({}) devem ter o mesmo tamanho.".format(
+                lons.size, lats.size))
+
+        # Candidatos pelo retângulo envolvente de cada geometria.
+        pontos, geometrias = self.indice.query(shapely.points(lons, lats))
+
+        # Teste ponto-em-polígono, vetorizado para os candidatos de cada geometria.
+        dentro = np.zeros(pontos.size, dtype=bool)
+        for g in np.unique(geometrias):
+            sel = geometrias == g
+            dentro[sel] = shapely.intersects_xy(self.geometrias[g], lons[pontos[sel]], lats[pontos[sel]])
+
+        pontos = pontos[dentro]
+        geometrias = geometrias[dentro]
+
+        ordem = np.lexsort((geometrias, pontos))
+
+        return(pontos[ordem].astype(np.int64), geometrias[ordem].astype(np.int64))
+
+    def localizar(self, lons, lats, campo=None):
+        """
+        Identifica, para cada ponto, a geometria do arquivo shape que o contém.
+
+        A consulta é feita de uma só vez para todos os pontos, utilizando o índice espacial (ver
+        'localizarTodas'). Pontos em mais de uma geometria (sobrepostas ou na divisa) são atribuídos à de menor
+        índice. Requer shapely 2.0 ou superior.
+
+        Argumentos
+        ----------
+        lons : Lista ou array com as longitudes dos pontos;
+
+        lats : Lista ou array com as latitudes dos pontos;
+
+        campo : (Opcional) Nome do campo do arquivo 'dbf' a retornar (ex.: 'LAYER' em 'Bacias.shp').
+
+        Retorno
+        -------
+        Se 'campo' não for declarado, array com o índice da geometria de cada ponto (-1 para pontos fora de todas).
+        Caso contrário, array com o valor do campo para cada ponto ('None' para pontos fora de todas).
+        """
+
+        pontos, geometrias = self.localizarTodas(lons, lats)
+
+        # Mantém apenas a primeira geometria (menor índice) de cada ponto.
+        primeiro = np.ones(pontos.size, dtype=bool)
+        primeiro[1:] = pontos[1:] != pontos[:-1]
+
+        resultado = np.full(np.size(lons), -1, dtype=np.int64)
+        resultado[pontos[primeiro]] = geometrias[primeiro]
+
+        if campo is None:
+            return(resultado)
+
+        valores = np.array([a.get(campo) for a in self.atributos] + [None], dtype=object)
+
+        return(valores[resultado])
+
+    def __getstate__(self):
+        # O índice espacial não é serializado (por exemplo, ao enviar o objeto para outro processo);
+        # ele é reconstruído sob demanda no destino.
+        estado = self.__dict__.copy()
+        estado['_indice'] = None
+        return(estado)
+
 
 # Funções
 
@@ -113,8 +280,8 @@ def plotarMapa(titulo, lons, lats, dados, modeloMapa, destino='', shapeFile=-1):
     # Fecha uma figura anterior, se houver.
     plt.close()
 
-    # Determina o tamanho do gráfico no console do Python.
-    fig = plt.figure(figsize=(5, 5))
+    # Determina o tamanho e a resolução do gráfico.
+    fig = plt.figure(figsize=myMap.figura_tamanho, dpi=myMap.figura_dpi)
 
     # Detemina tipo de projeção.
     ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
@@ -122,11 +289,10 @@ def plotarMapa(titulo, lons, lats, dados, modeloMapa, destino='', shapeFile=-1):
     # Delimita o mapa.
     ax.set_extent(myMap.mapa_coordenadas, ccrs.PlateCarree())
 
-    # Adiciona algumas caracteristica no mapa.
+    # Adiciona as camadas do Natural Earth definidas no modelo, na resolução escolhida.
     # Talvez, no primeiro uso, o 'matplotlib'/'cartopy' execute o download de mapas com as características requeridas.
-    ax.add_feature(cartopy.feature.LAND)
-    ax.add_feature(cartopy.feature.COASTLINE)
-    ax.add_feature(cartopy.feature.BORDERS)
+    for camada in myMap.mapa_camadas:
+        ax.add_feature(_obterCamada(camada, myMap.mapa_resolucao))
 
     # Adiciona arquivos tipo 'shape' ao mapa.
     # Lista que conterá (ou não) strings, 'ArquivosShape' ou uma combinação.
@@ -147,46 +313,37 @@ def plotarMapa(titulo, lons, lats, dados, modeloMapa, destino='', shapeFile=-1):
             tmp = ArquivoShape(item)
             ax.add_feature(tmp.shape_feature)
 
-    # Variáveis auxiliares para ajuste do mapa de cores
-    infbound = None
-    supbound = None
-    extend = 'neither'
-
-    # Ajusta código de cores se necessário.
-    if (myMap.barraCores_corMinimo != '-1') and (myMap.barraCores_corMaximo != '-1'):
-        extend = 'both'
-        infbound = myMap.barraCores_corMinimo
-        supbound = myMap.barraCores_corMaximo
-    elif (myMap.barraCores_corMinimo != '-1'):
-        extend = 'min'
-        infbound = myMap.barraCores_corMinimo
-    else:
-        extend = 'max'
-        supbound = myMap.barraCores_corMaximo
-
-    # Cria mapa de cores.
-    cmap = (mpl.colors.ListedColormap(myMap.barraCores_codigos).with_extremes(
-        over=supbound, under=infbound))
-
-    # Cria o índice de cores do mapa
-    norm = mpl.colors.BoundaryNorm(myMap.barraCores_valores, cmap.N)
+    # Cria o mapa de cores e o índice de cores do mapa.
+    cmap, norm, extend = criaEscalaCores(myMap)
 
     # Cria o gráfico de acordo com o tipo selecionado.
+    # Para contornos, os polígonos são reaproveitados do cache (ver 'plotarContornos') e a barra de cores é
+    # construída diretamente a partir da escala de cores.
     if (myMap.mapa_tipo == 'contornos'):
-        filled = ax.contourf(lons, lats, dados, levels=myMap.barraCores_valores,
-                             cmap=cmap, norm=norm, extend=extend, transform=ccrs.PlateCarree())
+        filled = plotarContornos(ax, lons, lats, dados, myMap.barraCores_valores, cmap, norm, extend,
+                                 myMap.mapa_coordenadas)
+        barra = mpl.cm.ScalarMappable(norm=norm, cmap=cmap)
+        extendBarra = extend
     elif (myMap.mapa_tipo == 'xy'):
-        filled = ax.scatter(lons, lats, c=dados, s=50, alpha=1, cmap=cmap,
+        filled = ax.scatter(lons, lats, c=dados, s=myMap.xy_tamanhoMarcador, alpha=1, cmap=cmap,
                             norm=norm, edgecolors='black', transform=ccrs.PlateCarree())
+        barra = filled
+        extendBarra = None
     else:
         raise NameError(
             "Tipo de mapa (mapa_tipo) inválido! Verifique o arquivo de template.")
 
+    # Rasteriza os dados, mantendo vetoriais apenas os contornos e textos (útil para saídas 'pdf' e 'svg').
+    if myMap.mapa_rasterizar:
+        _rasterizar(filled)
+
     # Ajusta a barra de cores, se houver.
     if myMap.barraCores_orientacao != "none":
 
         cbar = fig.colorbar(
-            filled,
+            barra,
+            ax=ax,
+            extend=extendBarra,
             orientation=myMap.barraCores_orientacao,
             label=myMap.barraCores_titulo,
             spacing='uniform',
@@ -201,20 +358,232 @@ def plotarMapa(titulo, lons, lats, dados, modeloMapa, destino='', shapeFile=-1):
     # Define título do gráfico.
     plt.title(titulo)
 
-    # Adiciona grid.
-    g1 = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True,
-                      linewidth=1, color='gray', alpha=0.5, linestyle='--')
-    g1.top_labels = False
-    g1.right_labels = False
-    g1.xlabel_style = {'size': 9, 'color': 'blue', 'weight': 'bold'}
-    g1.ylabel_style = {'size': 9, 'color': 'red', 'weight': 'bold'}
+    # Adiciona grid, se habilitado no modelo.
+    if myMap.mapa_grade:
+        g1 = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True,
+                          linewidth=1, color='gray', alpha=0.5, linestyle='--')
+        g1.top_labels = False
+        g1.right_labels = False
+        g1.xlabel_style = {'size': 9, 'color': 'blue', 'weight': 'bold'}
+        g1.ylabel_style = {'size': 9, 'color': 'red', 'weight': 'bold'}
 
     # Mostra na tela ou salva em arquivo.
     if destino == '':
         plt.show(block=True)
 
     else:
-        fig.savefig(destino)
+        # Nível de compressão do 'png' (0 a 9). Valores negativos mantêm o padrão do 'matplotlib'.
+        opcoes = {}
+        if myMap.saida_compressao >= 0 and destino.lower().endswith('.png'):
+            opcoes['pil_kwargs'] = {'compress_level': myMap.saida_compressao}
+
+        fig.savefig(destino, dpi=myMap.figura_dpi, **opcoes)
+
+    # Libera a figura e seus artistas (evita o acúmulo de memória em execuções longas).
+    fig.clf()
+    plt.close(fig)
+
+
+def criaEscalaCores(modeloMapa):
+    """
+    Cria a escala de cores definida em um modelo de mapa.
+
+    Argumentos
+    ----------
+    modeloMapa : objeto tipo 'Mapa'.
+
+    Retorno
+    -------
+    Tupla (cmap, norm, extend): mapa de cores ('ListedColormap'), índice de cores ('BoundaryNorm') e
+    extremos da barra de cores ('both', 'min' ou 'max').
+    """
+
+    # Variáveis auxiliares para ajuste do mapa de cores
+    infbound = None
+    supbound = None
+    extend = 'neither'
+
+    # Ajusta código de cores se necessário.
+    if (modeloMapa.barraCores_corMinimo != '-1') and (modeloMapa.barraCores_corMaximo != '-1'):
+        extend = 'both'
+        infbound = modeloMapa.barraCores_corMinimo
+        supbound = modeloMapa.barraCores_corMaximo
+    elif (modeloMapa.barraCores_corMinimo != '-1'):
+        extend = 'min'
+        infbound = modeloMapa.barraCores_corMinimo
+    else:
+        extend = 'max'
+        supbound = modeloMapa.barraCores_corMaximo
+
+    # Cria mapa de cores.
+    cmap = (mpl.colors.ListedColormap(modeloMapa.barraCores_codigos).with_extremes(
+        over=supbound, under=infbound))
+
+    # Cria o índice de cores do mapa
+    norm = mpl.colors.BoundaryNorm(modeloMapa.barraCores_valores, cmap.N)
+
+    return(cmap, norm, extend)
+
+
+def configurarCacheContornos(tamanho=32, pasta=''):
+    """
+    Configura o cache de contornos utilizado em 'plotarMapa' (mapa_tipo:contornos).
+
+    Argumentos
+    ----------
+    tamanho : Número máximo de contornos mantidos em memória. Os menos usados recentemente são descartados.
+        Utilizar 0 para desativar o cache em memória.
+
+    pasta : (Opcional) Pasta para gravar/ler os contornos em disco. Se não declarada, usa apenas memória.
+    """
+
+    global _tamanhoCacheContornos, _pastaCacheContornos
+
+    _tamanhoCacheContornos = tamanho
+    _pastaCacheContornos = pasta
+
+    while len(_cacheContornos) > max(tamanho, 0):
+        _cacheContornos.popitem(last=False)
+
+
+def limparCacheContornos():
+    """
+    Descarta os contornos mantidos em memória pelo cache de 'plotarMapa' (o cache em disco é mantido).
+    """
+
+    _cacheContornos.clear()
+
+
+def plotarContornos(ax, lons, lats, dados, niveis, cmap, norm, extend='neither', extensao=None):
+    """
+    Plota os contornos preenchidos de uma grade, reaproveitando os polígonos de chamadas anteriores.
+
+    Na primeira vez, os contornos são gerados pelo 'contourf' e os seus polígonos (vértices e códigos de cada
+    faixa) ficam em cache, indexados pela grade, pelos níveis, pelos extremos, pela área do mapa, pelas opções de
+    contorno do 'matplotlib' e pelas versões do 'matplotlib' e do 'contourpy'. Nas chamadas seguintes, o
+    'ContourSet' é construído diretamente a partir desses polígonos. Assim, o mesmo dado plotado com outro título,
+    barra de cores ou tamanho de figura não recalcula os contornos.
+
+    Argumentos
+    ----------
+    ax : Eixo ('GeoAxes') do mapa;
+
+    lons, lats : Listas (1D) ou matrizes (2D) com as longitudes e latitudes;
+
+    dados : Matriz com os dados;
+
+    niveis : Lista com os níveis dos contornos ('barraCores_valores');
+
+    cmap, norm : Mapa de cores e índice de cores (ver 'criaEscalaCores');
+
+    extend : (Opcional) 'neither', 'both', 'min' ou 'max'. Adiciona as faixas abaixo/acima dos níveis extremos;
+
+    extensao : (Opcional) Área do mapa ('mapa_coordenadas'), usada apenas na chave do cache.
+
+    Retorno
+    -------
+    Objeto 'ContourSet' plotado.
+    """
+
+    dados = np.ma.masked_invalid(np.asarray(dados, dtype=float))
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+
+    chave = hashlib.sha1()
+    for array in (lons, lats, dados.filled(np.nan), np.asarray(niveis, dtype=float)):
+        chave.update(str(array.shape).encode())
+        chave.update(np.ascontiguousarray(array).tobytes())
+    # Os polígonos também dependem do algoritmo de contorno e das versões das bibliotecas: o cache em disco não
+    # é reaproveitado após uma atualização ou mudança de opções.
+    chave.update('|{}|{}|{}|{}|{}|{}'.format(
+        extend, extensao, mpl.rcParams.get('contour.algorithm'), mpl.rcParams.get('contour.corner_mask'),
+        mpl.__version__, versaoContourpy).encode())
+    chave = chave.hexdigest()
+
+    arquivoCache = os.path.join(_pastaCacheContornos, 'contornos_{}.pkl'.format(chave)) \
+        if _pastaCacheContornos != '' else ''
+
+    # Cache em memória (LRU) e, em seguida, em disco.
+    contornos = None
+    if chave in _cacheContornos:
+        _cacheContornos.move_to_end(chave)
+        contornos = _cacheContornos[chave]
+    elif arquivoCache != '' and os.path.isfile(arquivoCache):
+        with open(arquivoCache, 'rb') as f:
+            contornos = pickle.load(f)
+
+    if contornos is None:
+        filled = ax.contourf(lons, lats, dados, levels=niveis, cmap=cmap, norm=norm, extend=extend,
+                             transform=ccrs.PlateCarree())
+
+        # Níveis efetivos do 'contourf' ('_levels', que incluem as faixas de extremos de 'extend'), no formato
+        # aceito por 'ContourSet' com polígonos já calculados.
+        contornos = (list(filled._levels), [list(segs) for segs in filled.allsegs],
+                     [list(kinds) for kinds in filled.allkinds])
+
+        if arquivoCache != '':
+            os.makedirs(_pastaCacheContornos, exist_ok=True)
+            with open(arquivoCache, 'wb') as f:
+                pickle.dump(contornos, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    elif any(len(segs) > 0 for segs in contornos[1]):
+        niveisEfetivos, allsegs, allkinds = contornos
+        filled = mpl.contour.ContourSet(ax, niveisEfetivos, allsegs, allkinds, filled=True, cmap=cmap, norm=norm,
+                                        transform=ccrs.PlateCarree())
+
+    else:
+        # Sem nenhum polígono (por exemplo, grade sem valores na faixa dos níveis), o 'ContourSet' não pode ser
+        # construído a partir do cache.
+        filled = ax.contourf(lons, lats, dados, levels=niveis, cmap=cmap, norm=norm, extend=extend,
+                             transform=ccrs.PlateCarree())
+
+    if _tamanhoCacheContornos > 0:
+        _cacheContornos[chave] = contornos
+        while len(_cacheContornos) > _tamanhoCacheContornos:
+            _cacheContornos.popitem(last=False)
+
+    return(filled)
+
+
+def _obterCamada(nome, resolucao):
+    """
+    Retorna a camada do Natural Earth 'nome' na resolução informada, reaproveitando instâncias já criadas.
+    """
+
+    chave = (nome, resolucao)
+    if chave not in _cacheCamadas:
+        if nome not in camadasMapa:
+            raise NameError("Camada de mapa '{}' inválida! Utilize uma de: {}.".format(
+                nome, ', '.join(camadasMapa)))
+        _cacheCamadas[chave] = getattr(cartopy.feature, camadasMapa[nome]).with_scale(resolucao)
+
+    return(_cacheCamadas[chave])
+
+
+def _rasterizar(artista):
+    """
+    Marca o artista (ou as coleções de um 'ContourSet' em versões antigas do 'matplotlib') como rasterizado.
+    """
+
+    if hasattr(artista, 'set_rasterized'):
+        artista.set_rasterized(True)
+    else:
+        for colecao in artista.collections:
+            colecao.set_rasterized(True)
+
+
+def _textoParaBooleano(texto):
+    """
+    Converte os valores 'sim'/'nao', 'true'/'false' ou '1'/'0' de um template em booleano.
+    """
+
+    texto = texto.strip().lower()
+    if texto in ('sim', 'true', '1'):
+        return(True)
+    elif texto in ('nao', 'não', 'false', '0'):
+        return(False)
+
+    raise ValueError(texto)
 
 
 def loadMapTemplate(arquivoTemplateMapa):
@@ -227,6 +596,11 @@ def loadMapTemplate(arquivoTemplateMapa):
     arquivoTemplateMapa : nome do arquivo contendo template do Mapa.
         Este arquivo deve seguir, estritamente, o formato estabelecido.
 
+        Templates sem a chave 'mapa_versao' seguem o formato original (versão 1), com exatamente 11 linhas válidas.
+        Templates com 'mapa_versao:2' aceitam, opcionalmente, os parâmetros de renderização: 'figura_dpi',
+        'figura_tamanho', 'mapa_camadas', 'mapa_resolucao', 'mapa_grade', 'mapa_rasterizar',
+        'xy_tamanho_marcador' e 'saida_compressao'.
+
     Retorno
     -------
     objeto Mapa (ver definição da classe 'Mapa' neste arquivo).        
@@ -236,7 +610,7 @@ def loadMapTemplate(arquivoTemplateMapa):
     # Lista com as linhas lidas do arquivo de template de um mapa.
     lines = []
 
-    # Número de linhas válidas esperado.
+    # Número de linhas válidas esperado (formato versão 1).
     check_valid_lines = 11
 
     # Contador de linhas válidas.
@@ -264,7 +638,7 @@ def loadMapTemplate(arquivoTemplateMapa):
                     if (':' in line):
                         lines.append(line)
                         valid_lines = valid_lines + 1
-                        listValues = line.split(':')
+                        listValues = line.split(':', 1)
                         map_dict[listValues[0]] = listValues[1]
                     else:
                         raise NameError("Linha inválida no arquivo de template '{}'. Verique a linha {}.".format(
@@ -274,10 +648,29 @@ def loadMapTemplate(arquivoTemplateMapa):
         raise NameError("Erro ao tentar abrir o arquivo de template para o mapa [{}]!\nVerifique o caminho completo do arquivo e tente novamente.".format(
             arquivoTemplateMapa))
 
-    # Verifica se o arquivo contem o número de linhas válidas.
-    if valid_lines != check_valid_lines:
-        raise NameError("O arquivo de template '{}' contêm {} linhas válidas, quando o esperado são {} linhas.".format(
-            arquivoTemplateMapa, valid_lines, check_valid_lines))
+    # Verifica a versão do formato do template.
+    try:
+        versao = int(map_dict.get('mapa_versao', 1))
+    except ValueError:
+        raise NameError("Versão inválida no arquivo de template '{}': '{}'.".format(
+            arquivoTemplateMapa, map_dict['mapa_versao']))
+
+    if versao == 1:
+        # Verifica se o arquivo contem o número de linhas válidas ('mapa_versao:1' explícito não é contado).
+        if valid_lines - ('mapa_versao' in map_dict) != check_valid_lines:
+            raise NameError("O arquivo de template '{}' contêm {} linhas válidas, quando o esperado são {} linhas.".format(
+                arquivoTemplateMapa, valid_lines, check_valid_lines))
+
+    elif versao == 2:
+        # Verifica se há chaves desconhecidas (por exemplo, erros de digitação).
+        invalidas = set(map_dict) - _chavesTemplateV1 - _chavesTemplateV2
+        if invalidas:
+            raise NameError("O arquivo de template '{}' contêm chaves inválidas: {}.".format(
+                arquivoTemplateMapa, ', '.join(sorted(invalidas))))
+
+    else:
+        raise NameError("Versão {} do arquivo de template '{}' não suportada.".format(
+            versao, arquivoTemplateMapa))
 
     # Aloca os valores em um objeto do tipo 'Mapa'
     # TODO: Comentar alocações abaixo, se necessário
@@ -305,8 +698,55 @@ def loadMapTemplate(arquivoTemplateMapa):
         tmp = map_dict['mapa_coordenadas'].split(',')
         local_map.mapa_coordenadas = [float(i) for i in tmp]
 
+        # Parâmetros de renderização (versão 2). Se ausentes, permanecem os valores padrão da classe 'Mapa'.
+        local_map.mapa_versao = versao
+
+        if 'figura_dpi' in map_dict:
+            local_map.figura_dpi = float(map_dict['figura_dpi'])
+
+        if 'figura_tamanho' in map_dict:
+            tmp = map_dict['figura_tamanho'].split(',')
+            local_map.figura_tamanho = [float(i) for i in tmp]
+
+        if 'mapa_camadas' in map_dict:
+            tmp = map_dict['mapa_camadas'].split(',')
+            local_map.mapa_camadas = [i.strip() for i in tmp if i.strip() != '']
+
+        if 'mapa_resolucao' in map_dict:
+            local_map.mapa_resolucao = map_dict['mapa_resolucao'].strip()
+
+        if 'mapa_grade' in map_dict:
+            local_map.mapa_grade = _textoParaBooleano(map_dict['mapa_grade'])
+
+        if 'mapa_rasterizar' in map_dict:
+            local_map.mapa_rasterizar = _textoParaBooleano(map_dict['mapa_rasterizar'])
+
+        if 'xy_tamanho_marcador' in map_dict:
+            local_map.xy_tamanhoMarcador = float(map_dict['xy_tamanho_marcador'])
+
+        if 'saida_compressao' in map_dict:
+            local_map.saida_compressao = int(map_dict['saida_compressao'])
+
     except:
         raise NameError("Erro ao tentar interpretar o arquivo de template [{}] para o mapa!\nVerifique a sintaxe do arquivo e tente novamente.".format(
             arquivoTemplateMapa))
 
+    # Verifica os valores dos parâmetros de renderização.
+    if len(local_map.figura_tamanho) != 2:
+        raise NameError("O parâmetro 'figura_tamanho' do template '{}' deve conter largura e altura.".format(
+            arquivoTemplateMapa))
+
+    if local_map.mapa_resolucao not in resolucoesMapa:
+        raise NameError("Resolução '{}' inválida no template '{}'. Utilize uma de: {}.".format(
+            local_map.mapa_resolucao, arquivoTemplateMapa, ', '.join(resolucoesMapa)))
+
+    for camada in local_map.mapa_camadas:
+        if camada not in camadasMapa:
+            raise NameError("Camada '{}' inválida no template '{}'. Utilize uma de: {}.".format(
+                camada, arquivoTemplateMapa, ', '.join(camadasMapa)))
+
+    if local_map.saida_compressao > 9:
+        raise NameError("O parâmetro 'saida_compressao' do template '{}' deve estar entre 0 e 9.".format(
+            arquivoTemplateMapa))
+
     return(local_map)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+"""
+******************************************************************************
+tiles.py - Exportação de grades em pirâmide de tiles XYZ (Web Mercator)
+
+Gera tiles 'png' no padrão XYZ ('pasta/z/x/y.png'), utilizado por visualizadores
+web como Leaflet e OpenLayers. As cores seguem a escala de cores de um modelo de
+mapa ('Mapa'), a mesma utilizada em 'plotarMapa'.
+
+Licença : MIT
+Dependências: numpy, matplotlib e plotMap
+******************************************************************************
+"""
+
+import os
+import math
+from multiprocessing import Pool
+import numpy as np
+import matplotlib.image
+
+from plotMap.plotMap import Mapa, loadMapTemplate, criaEscalaCores
+
+
+# Latitude máxima da projeção Web Mercator.
+latitudeMaxima = 85.0511287798
+
+# Dados compartilhados com os processos de trabalho (ver '_iniciarTrabalhador').
+_dadosTrabalhador = {}
+
+
+# Funções
+
+def exportarTiles(lons, lats, dados, modeloMapa, pastaDestino, zoomMin=3, zoomMax=7, tamanhoTile=256,
+                  processos=1, compressao=1, removerAntigos=True):
+    """
+    Exporta uma grade como pirâmide de tiles XYZ colorizados com a escala de cores do modelo de mapa.
+
+    São gerados apenas os tiles que interceptam a área 'mapa_coordenadas' do modelo. Tiles sem nenhum
+    ponto colorido (sem dados ou fora da área) não são gravados e, com 'removerAntigos', os tiles de uma
+    exportação anterior na mesma pasta que não foram gravados agora são apagados, para que o visualizador
+    não exiba dados antigos.
+
+    Argumentos
+    ----------
+    lons : Lista com as longitudes da grade (crescentes);
+
+    lats : Lista com as latitudes da grade (crescentes);
+
+    dados : Matriz (latitudes x longitudes) com os dados. Valores 'nan' ficam transparentes;
+
+    modeloMapa : string ou objeto tipo 'Mapa' (ver 'plotarMapa');
+
+    pastaDestino : Pasta raiz da pirâmide de tiles;
+
+    zoomMin, zoomMax : (Opcional) Níveis de zoom, inclusive;
+
+    tamanhoTile : (Opcional) Tamanho dos tiles, em pixels;
+
+    processos : (Opcional) Número de processos para gerar os tiles em paralelo;
+
+    compressao : (Opcional) Nível de compressão dos arquivos 'png', de 0 a 9;
+
+    removerAntigos : (Opcional) Apaga os tiles ('z/x/y.png') dos níveis de zoom exportados que não foram
+        gravados nesta exportação. Outros arquivos e níveis de zoom da pasta são mantidos.
+
+    Retorno
+    -------
+    Lista com os arquivos gravados.
+    """
+
+    tipoModelo = type(modeloMapa)
+    if tipoModelo is str:
+        myMap = loadMapTemplate(modeloMapa)
+    elif tipoModelo is Mapa:
+        myMap = modeloMapa
+    else:
+        raise NameError(
+            "O argumento 'modeloMapa' deve ser uma string ou um tipo 'Mapa'!")
+
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    dados = np.asarray(dados, dtype=np.float32)
+
+    if dados.shape != (len(lats), len(lons)):
+        raise NameError("Formato dos dados {} diferente do esperado ({}, {}).".format(
+            dados.shape, len(lats), len(lons)))
+
+    cmap, norm, extend = criaEscalaCores(myMap)
+
+    # Tiles que interceptam a área do mapa, em todos os níveis de zoom.
+    oeste, leste, sul, norte = myMap.mapa_coordenadas
+    tarefas = []
+    for z in range(zoomMin, zoomMax + 1):
+        x0, y0 = _lonLatParaTile(oeste, norte, z)
+        x1, y1 = _lonLatParaTile(leste, sul, z)
+        tarefas.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+    parametros = (lons, lats, dados, cmap, norm, extend, myMap.barraCores_valores,
+                  myMap.mapa_coordenadas, pastaDestino, tamanhoTile, compressao)
+
+    if processos > 1 and len(tarefas) > 1:
+        with Pool(processos, initializer=_iniciarTrabalhador, initargs=parametros) as pool:
+            gravados = pool.map(_gerarTile, tarefas, chunksize=max(1, len(tarefas) // (4 * processos)))
+    else:
+        _iniciarTrabalhador(*parametros)
+        gravados = [_gerarTile(t) for t in tarefas]
+
+    gravados = [g for g in gravados if g != '']
+
+    if removerAntigos:
+        _removerTilesAntigos(pastaDestino, range(zoomMin, zoomMax + 1), gravados)
+
+    return(gravados)
+
+
+def _removerTilesAntigos(pastaDestino, zooms, gravados):
+    """
+    Apaga os tiles ('z/x/y.png') dos níveis de zoom informados que não estão na lista de gravados, removendo as
+    pastas que ficarem vazias. Retorna a lista de arquivos apagados.
+    """
+
+    manter = {os.path.normpath(g) for g in gravados}
+    apagados = []
+
+    for z in zooms:
+        pastaZoom = os.path.join(pastaDestino, str(z))
+        if not os.path.isdir(pastaZoom):
+            continue
+
+        for x in os.listdir(pastaZoom):
+            pastaX = os.path.join(pastaZoom, x)
+            if not (x.isdigit() and os.path.isdir(pastaX)):
+                continue
+
+            for nome in os.listdir(pastaX):
+                arquivo = os.path.normpath(os.path.join(pastaX, nome))
+                y, extensao = os.path.splitext(nome)
+                if extensao == '.png' and y.isdigit() and arquivo not in manter:
+                    os.remove(arquivo)
+                    apagados.append(arquivo)
+
+            if not os.listdir(pastaX):
+                os.rmdir(pastaX)
+
+    return(apagados)
+
+
+def _lonLatParaTile(lon, lat, z):
+    """
+    Retorna os índices (x, y) do tile XYZ que contém o ponto, no nível de zoom 'z'.
+    """
+
+    n = 2 ** z
+    lat = max(min(lat, latitudeMaxima), -latitudeMaxima)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+
+    return(min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+
+
+def _indicesVizinhos(eixo, valores):
+    """
+    Retorna o índice do ponto do eixo (crescente) mais próximo de cada valor, ou -1 se o valor estiver a mais
+    de meio espaçamento das extremidades do eixo.
+    """
+
+    if len(eixo) == 1:
+        return(np.zeros(valores.shape, dtype=np.int64))
+
+    meios = (eixo[1:] + eixo[:-1]) / 2
+    indices = np.searchsorted(meios, valores)
+
+    fora = (valores < eixo[0] - (eixo[1] - eixo[0]) / 2) | (valores > eixo[-1] + (eixo[-1] - eixo[-2]) / 2)
+    indices[fora] = -1
+
+    return(indices)
+
+
+def _iniciarTrabalhador(lons, lats, dados, cmap, norm, extend, niveis, extensao, pastaDestino, tamanhoTile,
+                        compressao):
+    """
+    Guarda os dados comuns a todos os tiles no processo atual.
+    """
+
+    _dadosTrabalhador.update(lons=lons, lats=lats, dados=dados, cmap=cmap, norm=norm, extend=extend,
+                             niveis=niveis, extensao=extensao, pastaDestino=pastaDestino,
+                             tamanhoTile=tamanhoTile, compressao=compressao)
+
+
+def _gerarTile(tarefa):
+    """
+    Gera e grava um tile. Retorna o nome do arquivo gravado ou '' se o tile estiver vazio.
+    """
+
+    z, x, y = tarefa
+    d = _dadosTrabalhador
+    n = 2 ** z
+    t = d['tamanhoTile']
+
+    # Coordenadas dos centros dos pixels do tile. Em Web Mercator, longitudes dependem apenas da coluna e
+    # latitudes apenas da linha: a amostragem da grade é separável.
+    pixels = (np.arange(t) + 0.5) / t
+    lonPixels = (x + pixels) / n * 360.0 - 180.0
+    latPixels = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (y + pixels) / n))))
+
+    oeste, leste, sul, norte = d['extensao']
+    colunas = _indicesVizinhos(d['lons'], lonPixels)
+    linhas = _indicesVizinhos(d['lats'], latPixels)
+    colunas[(lonPixels < oeste) | (lonPixels > leste)] = -1
+    linhas[(latPixels < sul) | (latPixels > norte)] = -1
+
+    if (colunas < 0).all() or (linhas < 0).all():
+        return('')
+
+    valores = d['dados'][linhas[:, np.newaxis], colunas[np.newaxis, :]]
+    valores[(linhas < 0)[:, np.newaxis] | (colunas < 0)[np.newaxis, :]] = np.nan
+
+    # Sem faixas de extremos, como no 'contourf', valores fora dos níveis ficam transparentes.
+    if d['extend'] not in ('both', 'min'):
+        valores[valores < d['niveis'][0]] = np.nan
+    if d['extend'] not in ('both', 'max'):
+        valores[valores > d['niveis'][-1]] = np.nan
+
+    if np.isnan(valores).all():
+        return('')
+
+    rgba = d['cmap'](d['norm'](np.ma.masked_invalid(valores)), bytes=True)
+
+    pasta = os.path.join(d['pastaDestino'], str(z), str(x))
+    os.makedirs(pasta, exist_ok=True)
+    arquivo = os.path.join(pasta, '{}.png'.format(y))
+    matplotlib.image.imsave(arquivo, rgba, format='png', pil_kwargs={'compress_level': d['compressao']})
+
+    return(arquivo)
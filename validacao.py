@@ -0,0 +1,277 @@
+"""Validacao vetorizada das grades antes da plotagem
+
+Verifica valores 'undef' (GrADS), pontos duplicados, lacunas e regularidade dos eixos de longitude e latitude,
+faixa de valores e area em relacao ao modelo de mapa. Todos os problemas encontrados sao reunidos em um unico
+relatorio, antes de qualquer custo de criacao da figura.
+    """
+
+import numpy as np
+
+
+# Valores 'undef' usuais em arquivos GrADS. Valores com modulo a partir de LIMITE_UNDEF tambem sao considerados.
+VALORES_UNDEF = (-999.0, -9999.0, -99999.0, 9.999e20)
+LIMITE_UNDEF = 1e20
+
+
+class ErroValidacao(NameError):
+    """Erro lancado quando uma grade nao passa na validacao. O relatorio completo fica em 'relatorio'
+    """
+
+    def __init__(self, relatorio):
+        super().__init__(str(relatorio))
+        self.relatorio = relatorio
+
+
+class RelatorioValidacao:
+    """Resultado da validacao de uma grade
+
+    Attributes:
+        origem (string): arquivo ou descricao da grade validada
+        erros (list): problemas que impedem a plotagem
+        avisos (list): problemas que nao impedem a plotagem
+        estatisticas (dict): contagens e valores calculados na validacao
+    """
+
+    def __init__(self, origem=''):
+        self.origem = origem
+        self.erros = []
+        self.avisos = []
+        self.estatisticas = {}
+
+    @property
+    def ok(self):
+        """True se nao houver erros"""
+        return len(self.erros) == 0
+
+    def para_dict(self):
+        """Retorna o relatorio como dicionario (por exemplo, para saida em JSON)"""
+        return {'origem': self.origem, 'ok': self.ok, 'erros': list(self.erros),
+                'avisos': list(self.avisos), 'estatisticas': dict(self.estatisticas)}
+
+    def __str__(self):
+        linhas = [f"Validacao de {self.origem or 'grade'}: {'ok' if self.ok else 'REJEITADA'}"]
+        linhas += [f"  ERRO: {e}" for e in self.erros]
+        linhas += [f"  aviso: {a}" for a in self.avisos]
+        return '\n'.join(linhas)
+
+
+def mascara_undef(valores, undef=VALORES_UNDEF):
+    """Substitui os valores 'undef' por nan
+
+    Args:
+        valores (array): valores lidos (float)
+        undef (tuple): valores considerados 'undef'
+
+    Returns:
+        tuple: (valores com nan, numero de valores mascarados)
+    """
+
+    valores = np.asarray(valores)
+    mascara = np.isin(valores, np.asarray(undef, dtype=valores.dtype)) | (np.abs(valores) >= LIMITE_UNDEF)
+    n = int(np.count_nonzero(mascara))
+    if n:
+        valores = np.where(mascara, np.nan, valores).astype(valores.dtype)
+
+    return valores, n
+
+
+def valida_eixo(eixo, nome, relatorio, tolerancia=1e-3):
+    """Verifica se um eixo (crescente, sem duplicados) eh regular, registrando lacunas e irregularidades
+
+    Args:
+        eixo (array): valores unicos e ordenados do eixo
+        nome (string): 'longitude' ou 'latitude', para as mensagens
+        relatorio (RelatorioValidacao): relatorio a atualizar
+        tolerancia (float): tolerancia relativa na comparacao dos espacamentos
+    """
+
+    if len(eixo) < 2:
+        relatorio.erros.append(f"eixo de {nome} com {len(eixo)} ponto(s); sao necessarios ao menos 2")
+        return
+
+    espacamentos = np.diff(eixo.astype(np.float64))
+    passo = float(np.min(espacamentos))
+    relatorio.estatisticas[f'passo_{nome}'] = passo
+
+    # espacamentos multiplos inteiros do passo indicam linhas/colunas ausentes; os demais, grade irregular
+    razao = espacamentos / passo
+    multiplos = np.abs(razao - np.round(razao)) <= tolerancia * np.maximum(razao, 1)
+    lacunas = multiplos & (np.round(razao) > 1)
+    irregulares = ~multiplos
+
+    if lacunas.any():
+        ausentes = int((np.round(razao[lacunas]) - 1).sum())
+        relatorio.avisos.append(f"eixo de {nome} com {ausentes} valor(es) ausente(s) em {int(lacunas.sum())} lacuna(s)")
+    if irregulares.any():
+        relatorio.avisos.append(f"eixo de {nome} irregular em {int(irregulares.sum())} intervalo(s)")
+
+
+def valida_pontos(lon, lat, valores, origem='', undef=VALORES_UNDEF):
+    """Valida pontos (lon, lat, valor) lidos de um arquivo e monta a grade
+
+    Args:
+        lon, lat, valores (array): colunas lidas do arquivo
+        origem (string): arquivo de origem, para o relatorio
+        undef (tuple): valores considerados 'undef'
+
+    Returns:
+        tuple: (relatorio, lons, lats, grade). A grade tem nan nos pontos ausentes ou 'undef' e so eh montada
+            se nao houver erro nas coordenadas (do contrario, lons, lats e grade sao None)
+    """
+
+    relatorio = RelatorioValidacao(origem)
+    relatorio.estatisticas['pontos'] = int(len(valores))
+
+    if len(valores) == 0:
+        relatorio.erros.append('arquivo sem pontos')
+        return relatorio, None, None, None
+
+    coordenadas_invalidas = ~(np.isfinite(lon) & np.isfinite(lat))
+    if coordenadas_invalidas.any():
+        relatorio.erros.append(f"{int(coordenadas_invalidas.sum())} ponto(s) com coordenada invalida")
+        return relatorio, None, None, None
+
+    if (np.abs(lat) > 90).any() or (np.abs(lon) > 360).any():
+        relatorio.erros.append('coordenadas fora dos limites (latitude em [-90, 90], longitude em [-360, 360])')
+        return relatorio, None, None, None
+
+    valores, n_undef = mascara_undef(valores, undef)
+    relatorio.estatisticas['undef'] = n_undef
+    if n_undef:
+        relatorio.avisos.append(f"{n_undef} valor(es) 'undef' mascarado(s)")
+
+    lons = np.unique(lon)
+    lats = np.unique(lat)
+    valida_eixo(lons, 'longitude', relatorio)
+    valida_eixo(lats, 'latitude', relatorio)
+
+    # posicao de cada ponto na grade e deteccao de duplicados
+    indices = np.searchsorted(lats, lat).astype(np.int64) * len(lons) + np.searchsorted(lons, lon)
+    ordem = np.argsort(indices, kind='stable')
+    ordenados = indices[ordem]
+    repetidos = np.zeros(len(ordenados), dtype=bool)
+    repetidos[1:] = ordenados[1:] == ordenados[:-1]
+    n_duplicados = int(repetidos.sum())
+    relatorio.estatisticas['duplicados'] = n_duplicados
+
+    if n_duplicados:
+        v = valores[ordem]
+        conflitantes = repetidos.copy()
+        conflitantes[1:] &= ~((v[1:] == v[:-1]) | (np.isnan(v[1:]) & np.isnan(v[:-1])))
+        n_conflitantes = int(conflitantes.sum())
+        if n_conflitantes:
+            relatorio.erros.append(f"{n_conflitantes} ponto(s) duplicado(s) com valores diferentes")
+        else:
+            relatorio.avisos.append(f"{n_duplicados} ponto(s) duplicado(s) com valores iguais")
+
+    celulas = len(lons) * len(lats)
+    ausentes = celulas - (len(ordenados) - n_duplicados)
+    relatorio.estatisticas['forma'] = [len(lats), len(lons)]
+    relatorio.estatisticas['ausentes'] = int(ausentes)
+    if ausentes:
+        relatorio.avisos.append(f"{ausentes} de {celulas} ponto(s) da grade ausente(s) ({100.0 * ausentes / celulas:.1f}%)")
+
+    grade = np.full((len(lats), len(lons)), np.nan, dtype=valores.dtype)
+    grade.ravel()[indices] = valores
+
+    if np.isnan(grade).all():
+        relatorio.erros.append('grade sem nenhum valor valido')
+
+    return relatorio, lons, lats, grade
+
+
+def valida_modelo(modelo_mapa, relatorio):
+    """Verifica a consistencia de um modelo de mapa ('Mapa')
+
+    Args:
+        modelo_mapa (Mapa): modelo de mapa
+        relatorio (RelatorioValidacao): relatorio a atualizar
+    """
+
+    niveis = np.asarray(modelo_mapa.barraCores_valores, dtype=float)
+
+    if len(modelo_mapa.mapa_coordenadas) != 4:
+        relatorio.erros.append("modelo: 'mapa_coordenadas' deve ter 4 valores")
+    if len(niveis) < 2 or (np.diff(niveis) <= 0).any():
+        relatorio.erros.append("modelo: 'barra_cores_valores' deve ter ao menos 2 valores crescentes")
+    if len(modelo_mapa.barraCores_codigos) != len(niveis) - 1:
+        relatorio.erros.append(f"modelo: {len(modelo_mapa.barraCores_codigos)} cor(es) para "
+                               f"{len(niveis) - 1} intervalo(s) de 'barra_cores_valores'")
+
+
+def valida_grade(lons, lats, dados, modelo_mapa=None, origem='', undef=VALORES_UNDEF, relatorio=None):
+    """Valida uma grade ja montada, opcionalmente contra um modelo de mapa
+
+    Args:
+        lons, lats (array): eixos da grade
+        dados (array): grade (latitudes x longitudes)
+        modelo_mapa (Mapa): modelo de mapa para verificar a faixa de valores e a area
+        origem (string): arquivo de origem, para o relatorio
+        undef (tuple): valores considerados 'undef'
+        relatorio (RelatorioValidacao): relatorio de valida_pontos da mesma grade, a completar. Os eixos e os
+            valores 'undef', ja verificados por valida_pontos, nao sao verificados novamente
+
+    Returns:
+        tuple: (relatorio, dados), com os valores 'undef' de dados substituidos por nan
+    """
+
+    pontos_validados = relatorio is not None
+    if not pontos_validados:
+        relatorio = RelatorioValidacao(origem)
+
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    dados = np.asarray(dados)
+    if dados.dtype.kind != 'f':
+        dados = dados.astype(float)
+
+    if dados.shape != (len(lats), len(lons)):
+        relatorio.erros.append(f"formato da grade {dados.shape} diferente de ({len(lats)}, {len(lons)})")
+        return relatorio, dados
+
+    if not pontos_validados:
+        for eixo, nome in ((lons, 'longitude'), (lats, 'latitude')):
+            if len(eixo) > 1 and (np.diff(eixo) <= 0).any():
+                relatorio.erros.append(f"eixo de {nome} nao esta em ordem crescente ou tem valores repetidos")
+            else:
+                valida_eixo(eixo, nome, relatorio)
+
+        dados, n_undef = mascara_undef(dados, undef)
+        relatorio.estatisticas['undef'] = n_undef
+        if n_undef:
+            relatorio.avisos.append(f"{n_undef} valor(es) 'undef' mascarado(s)")
+
+    validos = np.isfinite(dados)
+    n_validos = int(validos.sum())
+    relatorio.estatisticas['validos'] = n_validos
+    if n_validos == 0:
+        relatorio.erros.append('grade sem nenhum valor valido')
+        return relatorio, dados
+
+    minimo = float(dados[validos].min())
+    maximo = float(dados[validos].max())
+    relatorio.estatisticas['minimo'] = minimo
+    relatorio.estatisticas['maximo'] = maximo
+
+    if modelo_mapa is not None:
+        valida_modelo(modelo_mapa, relatorio)
+        if not relatorio.ok:
+            return relatorio, dados
+
+        # area da grade x area do mapa
+        oeste, leste, sul, norte = modelo_mapa.mapa_coordenadas
+        if lons[-1] < oeste or lons[0] > leste or lats[-1] < sul or lats[0] > norte:
+            relatorio.erros.append('a grade nao intercepta a area do mapa (mapa_coordenadas)')
+
+        # faixa de valores x escala de cores; sem seta de extremo, esses pontos nao sao coloridos
+        niveis = modelo_mapa.barraCores_valores
+        abaixo = int((dados[validos] < niveis[0]).sum())
+        acima = int((dados[validos] > niveis[-1]).sum())
+        if abaixo and modelo_mapa.barraCores_corMinimo == '-1':
+            relatorio.avisos.append(f"{abaixo} ponto(s) abaixo do menor valor da escala ({niveis[0]:g}) sem cor")
+        if acima and modelo_mapa.barraCores_corMaximo == '-1':
+            relatorio.avisos.append(f"{acima} ponto(s) acima do maior valor da escala ({niveis[-1]:g}) sem cor")
+        if minimo == maximo:
+            relatorio.avisos.append(f"grade constante ({minimo:g})")
+
+    return relatorio, dados